@@ -1,5 +1,14 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class ApiConfig(AppConfig):
     name = 'api'
+
+    def ready(self):
+        # Подключение обработчиков сигналов
+        from api import signals  # noqa: F401
+        if settings.REQUEST_TIMING:
+            # Замер времени сериализаторов для RequestTimingMiddleware
+            from api import timing
+            timing.install()
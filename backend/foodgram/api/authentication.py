@@ -0,0 +1,44 @@
+"""
+Аутентификация по токену с кешем в памяти процесса.
+TokenAuthentication выполняет запрос Token + User на каждый запрос к api;
+здесь пользователь по ключу токена берется из LRU-кеша с ttl.
+Запись устаревает, когда меняется версия пользователя: выход (удаление
+токена), смена пароля, деактивация и любое другое сохранение
+пользователя (см. api/signals.py). Проверка версии - вызов stat,
+поэтому выход в одном процессе gunicorn действует и в остальных.
+"""
+import copy
+
+from django.conf import settings
+from rest_framework.authentication import TokenAuthentication
+
+from api.cache import LRUCache
+from api.versions import bump_version, get_version
+
+token_cache = LRUCache(settings.TOKEN_CACHE_SIZE, settings.TOKEN_CACHE_TTL)
+
+
+def get_user_version(user_id):
+    return f'tokens-user-{user_id}'
+
+
+def invalidate(user_id):
+    """Токены пользователя user_id должны быть проверены заново."""
+    bump_version(get_user_version(user_id))
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication с кешем соответствия токен -> пользователь."""
+
+    def authenticate_credentials(self, key):
+        cached = token_cache.get(key)
+        if cached is not None:
+            user, token, version = cached
+            if version == get_version(get_user_version(user.pk)):
+                # Копия: представление может изменить request.user
+                return copy.deepcopy(user), token
+            token_cache.delete(key)
+        user, token = super().authenticate_credentials(key)
+        token_cache.set(
+            key, (user, token, get_version(get_user_version(user.pk))))
+        return copy.deepcopy(user), token
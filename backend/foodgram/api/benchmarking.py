@@ -0,0 +1,59 @@
+"""
+Общие части команд замера (benchmark, benchmark_login,
+benchmark_recipe_write): отдельная тестовая база, хост запросов,
+замер одного вызова и перцентили.
+"""
+import math
+import os
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+
+
+@contextmanager
+def benchmark_database():
+    """
+    Отдельная тестовая база (как в manage.py test) и временный каталог
+    для кешей api и загруженных файлов. После замера база и каталог
+    удаляются; рабочая база, ее кеши и media не изменяются.
+    """
+    old_name = connection.settings_dict['NAME']
+    cache_dir = tempfile.mkdtemp()
+    connection.creation.create_test_db(
+        verbosity=0, autoclobber=True, serialize=False)
+    try:
+        with override_settings(
+            CACHE_DIR=cache_dir,
+            SHOPPING_LIST_CACHE_DIR=os.path.join(cache_dir, 'shopping_list'),
+            INGREDIENT_INDEX_SNAPSHOT=os.path.join(
+                cache_dir, 'ingredient_index.json'),
+            MEDIA_ROOT=os.path.join(cache_dir, 'media'),
+        ):
+            yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+def get_host():
+    """Хост из ALLOWED_HOSTS: ответы api содержат абсолютные ссылки."""
+    return settings.ALLOWED_HOSTS[0].lstrip('.').replace('*', 'localhost')
+
+
+def measure(call):
+    """Выполнить call(): (результат, время в мс, число запросов к базе)."""
+    with CaptureQueriesContext(connection) as context:
+        started = time.perf_counter()
+        result = call()
+        elapsed = (time.perf_counter() - started) * 1000
+    return result, elapsed, len(context)
+
+
+def percentile(timings, fraction):
+    """Перцентиль отсортированного списка (по ближайшему рангу)."""
+    return timings[math.ceil(len(timings) * fraction) - 1]
@@ -0,0 +1,60 @@
+"""Кеши в памяти процесса."""
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    Кеш ограниченного размера: при переполнении вытесняются записи,
+    которые дольше всего не использовались. Необязательный ttl (секунды)
+    ограничивает время жизни записи. Считает попадания и промахи.
+    """
+
+    def __init__(self, maxsize, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self.lock:
+            item = self.data.get(key)
+            if item is not None and (
+                self.ttl is None or item[1] > time.monotonic()
+            ):
+                self.data.move_to_end(key)
+                self.hits += 1
+                return item[0]
+            if item is not None:
+                del self.data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        expires = None if self.ttl is None else time.monotonic() + self.ttl
+        with self.lock:
+            self.data[key] = (value, expires)
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.data.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+    def stats(self):
+        """Размер кеша, попадания, промахи и доля попаданий."""
+        requests = self.hits + self.misses
+        return {
+            'size': len(self.data),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / requests if requests else 0.0,
+        }
@@ -2,6 +2,7 @@
 
 # api/serializers.py
 BAD_USERNAME_ERROR = {'error': 'Нельзя использовать me в качестве username!'}
+EMAIL_EXIST_ERROR = 'Пользователь с таким email уже существует!'
 VALIDATION_ERROR = {'error': 'Не хватаает обязательного поля!'}
 INGREDIENT_COUNT_MIN_ERROR = {'error': 'Количество ингредиента слишком малое!'}
 INGREDIENT_COUNT_MAX_ERROR = {
@@ -19,6 +20,9 @@ LIMIT_NAME_ERROR = {
     'error': 'Параметр запроса recipes_limit должен быть целым числом!'}
 FOLLOW_EXIST_ERROR = {'error': 'Подписка на автора уже существует!'}
 FOLLOW_YOURSELF_ERROR = {'error': 'Нельзя подписаться на себя самого!'}
+NOT_FOUND_ERROR = 'Не найден {name}: {ids}'
+IMAGE_FORMAT_ERROR = {'error': 'Картинка должна быть в формате base64!'}
+IMAGE_SIZE_ERROR = {'error': 'Картинка слишком большая!'}
 
 # api/views.py
 ERROR_MESSAGE_FOR_USERNAME = (
@@ -28,6 +32,8 @@ DELETE_SHOPPING_CART_RECIPES_ERROR = {'error': 'Рецепта не сущест
 DELETE_SHOPPING_CART_ERROR = {
     'error': 'В списке покупок рецепта не существует!'}
 FILE_NAME = 'shopping_list'
+SHOPPING_LIST_TYPE_ERROR = {
+    'error': 'Параметр запроса type должен быть одним из: pdf, csv, txt!'}
 ADD_RECIPE_IN_FAVORITE_ERROR = {'error': 'Указанный рецепт не существует!'}
 RECIPE_IN_FAVORITE_EXIST_ERROR = {
     'error': 'Указанный рецепт уже есть в избранном!'}
@@ -1,22 +1,40 @@
+from django.conf import settings
+from django.db import connection
+from django.db.models import Value
+from django.db.models.functions import Lower, StrIndex, Upper
 from django_filters.rest_framework import FilterSet
 from django_filters.rest_framework.filters import (AllValuesMultipleFilter,
-                                                   BooleanFilter, CharFilter)
-from rest_framework.filters import SearchFilter
+                                                   BooleanFilter, CharFilter,
+                                                   ChoiceFilter)
+from rest_framework.filters import BaseFilterBackend
 
+from api.ingredient_index import ingredient_index
 from recipes.models import Recipe
 
+POPULAR = 'popular'
+# Сортировка по числу добавлений в избранное (индекс recipe_popular_idx)
+POPULAR_ORDERING = ('-favorites_count', '-pub_date', '-id')
+
 
 class RecipeFilter(FilterSet):
-    """Кастомный фильтр для рецептов."""
+    """
+    Кастомный фильтр для рецептов.
+    GET http://127.0.0.1:8000/api/recipes/?ordering=popular
+    Сначала рецепты, которые чаще добавляют в избранное.
+    """
 
     author = CharFilter(field_name='author__username')
     tags = AllValuesMultipleFilter(field_name='tags__slug')
     is_favorited = BooleanFilter(method='get_favorite')
     is_in_shopping_cart = BooleanFilter(method='get_shopping_cart')
+    ordering = ChoiceFilter(
+        choices=((POPULAR, 'По популярности'),), method='get_ordering')
 
     class Meta:
         model = Recipe
-        fields = ('tags', 'author', 'is_favorited', 'is_in_shopping_cart')
+        fields = (
+            'tags', 'author', 'is_favorited', 'is_in_shopping_cart',
+            'ordering')
 
     def get_favorite(self, queryset, name, value):
         if value and not self.request.user.is_anonymous:
@@ -28,11 +46,55 @@ class RecipeFilter(FilterSet):
             return queryset.filter(recipe_in_cart__user=self.request.user)
         return queryset
 
+    def get_ordering(self, queryset, name, value):
+        return queryset.order_by(*POPULAR_ORDERING)
+
 
-class IngredientFilter(SearchFilter):
+class IngredientFilter(BaseFilterBackend):
     """
     Кастомный фильтр для ингридиентов.
     GET http://127.0.0.1:8000/api/ingredients/?name=абрикосовый
+    Сначала идут ингридиенты, название которых начинается с name
+    (индекс в памяти, без запроса к базе), затем - содержащие name
+    в середине названия (режим infix, GIN индекс pg_trgm).
+    GET http://127.0.0.1:8000/api/ingredients/?name=варенье&mode=prefix
+    Режим prefix - только поиск по началу названия.
     """
 
     search_param = 'name'
+    mode_param = 'mode'
+
+    def filter_queryset(self, request, queryset, view):
+        name = request.query_params.get(self.search_param, '').strip()
+        if not name or view.action != 'list':
+            return queryset
+        found = ingredient_index.search(name)
+        mode = request.query_params.get(
+            self.mode_param, settings.INGREDIENT_SEARCH_MODE)
+        if (
+            mode == 'infix'
+            and len(name) >= settings.INGREDIENT_INFIX_MIN_LENGTH
+        ):
+            found += self.search_infix(queryset, name)
+        return found
+
+    def search_infix(self, queryset, name):
+        """Поиск по подстроке, исключая совпадения с началом названия."""
+        if connection.vendor != 'postgresql':
+            # В SQLite нет pg_trgm: поиск по индексу в памяти
+            return ingredient_index.search_infix(name)
+        return self.query_infix(queryset, name)
+
+    def query_infix(self, queryset, name):
+        """
+        Поиск по подстроке в базе (GIN индекс pg_trgm). Порядок - как
+        у ingredient_index.search_infix: позиция вхождения, название
+        без учета регистра, id.
+        """
+        return list(queryset.filter(
+            name__icontains=name
+        ).exclude(
+            name__istartswith=name
+        ).annotate(
+            position=StrIndex(Upper('name'), Value(name.upper()))
+        ).order_by('position', Lower('name'), 'pk'))
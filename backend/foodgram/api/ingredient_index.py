@@ -0,0 +1,147 @@
+"""
+Индекс ингридиентов в памяти процесса для поиска по названию.
+Справочник небольшой (около 2200 строк) и меняется только через админку
+или команду import_into_db, поэтому поиск при каждом нажатии клавиши
+в форме рецепта выполняется без запросов к базе.
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+from django.db.models import Count
+
+from api.versions import INGREDIENTS_VERSION, bump_version, get_version
+from recipes.models import Ingredient
+
+# Символ больше любого символа в названии: граница диапазона префикса
+MAX_CHAR = '\U0010ffff'
+
+
+class IngredientIndex:
+    """
+    Отсортированный по названию список ингридиентов.
+    Поиск по префиксу - двоичный поиск, результат ранжируется по числу
+    рецептов, в которых используется ингридиент.
+    Построенный индекс сохраняется в файл-снимок, чтобы остальные процессы
+    gunicorn загружали его без запроса к базе.
+    Ключи и записи заменяются одним присваиванием entries, поэтому поиск
+    в другом потоке не увидит ключи одной версии с записями другой.
+    """
+
+    def __init__(self):
+        self.version = None
+        # Время чтения данных из базы (а не загрузки снимка)
+        self.loaded_at = 0
+        self.entries = ([], [])
+        self.lock = threading.Lock()
+
+    def search(self, prefix):
+        """Ингридиенты, название которых начинается с prefix."""
+        keys, records = self.refresh()
+        prefix = prefix.lower()
+        start = bisect_left(keys, prefix)
+        stop = bisect_left(keys, prefix + MAX_CHAR, start)
+        # Сортировка устойчивая: при равном числе рецептов - по названию
+        found = sorted(records[start:stop], key=lambda record: -record[1])
+        return [ingredient for ingredient, uses in found]
+
+    def search_infix(self, fragment):
+        """
+        Ингридиенты, в середине названия которых есть fragment.
+        Сортировка - по позиции вхождения, затем по названию.
+        """
+        keys, records = self.refresh()
+        fragment = fragment.lower()
+        found = []
+        for key, (ingredient, uses) in zip(keys, records):
+            position = key.find(fragment)
+            if position > 0:
+                found.append((position, key, ingredient))
+        found.sort(key=lambda item: item[:2])
+        return [ingredient for position, key, ingredient in found]
+
+    def is_fresh(self, version):
+        return (
+            version == self.version
+            and time.time() - self.loaded_at < settings.INGREDIENT_INDEX_TTL
+        )
+
+    def refresh(self):
+        """
+        Перечитать индекс, если данные изменились или истек TTL.
+        Возвращает актуальные (ключи, записи).
+        """
+        version = get_version(INGREDIENTS_VERSION)
+        if self.is_fresh(version):
+            return self.entries
+        with self.lock:
+            # Индекс мог обновить другой поток, пока этот ждал блокировку
+            if self.is_fresh(version):
+                return self.entries
+            snapshot = self.read_snapshot(version)
+            if snapshot is None:
+                created = time.time()
+                rows = self.read_database()
+                self.write_snapshot(version, created, rows)
+            else:
+                created, rows = snapshot
+            self.entries = self.build(rows)
+            self.loaded_at = created
+            self.version = version
+            return self.entries
+
+    def build(self, rows):
+        rows = sorted(rows, key=lambda row: (row[1].lower(), row[0]))
+        keys = [name.lower() for pk, name, unit, uses in rows]
+        records = [
+            (Ingredient(pk=pk, name=name, measurement_unit=unit), uses)
+            for pk, name, unit, uses in rows
+        ]
+        return keys, records
+
+    def read_database(self):
+        return list(Ingredient.objects.annotate(
+            uses=Count('recipes')
+        ).order_by().values_list('pk', 'name', 'measurement_unit', 'uses'))
+
+    def read_snapshot(self, version):
+        """
+        (время создания, строки) из файла-снимка, если он соответствует
+        версии и свежий.
+        """
+        try:
+            with open(settings.INGREDIENT_INDEX_SNAPSHOT,
+                      encoding='utf-8') as file:
+                snapshot = json.load(file)
+        except (OSError, ValueError):
+            return None
+        if (
+            snapshot.get('version') != version
+            or time.time() - snapshot.get('created', 0)
+            >= settings.INGREDIENT_INDEX_TTL
+        ):
+            return None
+        return snapshot['created'], snapshot['rows']
+
+    def write_snapshot(self, version, created, rows):
+        directory = os.path.dirname(settings.INGREDIENT_INDEX_SNAPSHOT)
+        os.makedirs(directory, exist_ok=True)
+        with tempfile.NamedTemporaryFile(
+            'w', dir=directory, encoding='utf-8', delete=False
+        ) as file:
+            json.dump(
+                {'version': version, 'created': created, 'rows': rows},
+                file, ensure_ascii=False)
+        os.replace(file.name, settings.INGREDIENT_INDEX_SNAPSHOT)
+
+
+def invalidate():
+    """Справочник ингридиентов изменился: индекс во всех процессах устарел."""
+    bump_version(INGREDIENTS_VERSION)
+
+
+ingredient_index = IngredientIndex()
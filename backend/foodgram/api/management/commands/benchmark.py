@@ -0,0 +1,278 @@
+import gc
+import json
+import os
+import random
+import shutil
+import statistics
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api.benchmarking import (benchmark_database, get_host, measure,
+                              percentile)
+from recipes.management.commands.import_into_db import PATH_TO_JSON_FILES
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            RecipeTag, ShoppingCart, Tag)
+from users.models import Follow, User
+
+HELP_MESSAGE = 'Замер времени основных запросов api на тестовых данных'
+SEED_MESSAGE = (
+    'Набор {scale}: {users} пользователей, {recipes} рецептов, '
+    '{ingredients} ингридиентов; заполнено за {elapsed:.1f} с')
+RESULT_MESSAGE = (
+    '{case:<24} p50 {p50:7.1f} мс  p95 {p95:7.1f} мс  '
+    'запросов {queries:>3}{change}')
+CHANGE_MESSAGE = '  ({p50:+.0%} p50, запросов было {queries})'
+SAVE_MESSAGE = 'Результаты сохранены в {path}'
+REGRESSION_MESSAGE = '{case}: {reason}'
+SLOWER_REASON = 'p50 {old:.1f} -> {new:.1f} мс'
+QUERIES_REASON = 'запросов {old} -> {new}'
+REGRESSION_ERROR = 'Замедление относительно {path}: {count}'
+NO_INGREDIENTS_ERROR = 'Файл {path} не найден: укажите --ingredients.'
+RESPONSE_ERROR = '{case}: ответ {status}'
+# Детерминированные наборы данных: пользователи, рецепты и число
+# подписок, рецептов в избранном и в списке покупок у пользователя
+SCALES = {
+    'small': {
+        'users': 50, 'recipes': 500,
+        'follows': 10, 'favorites': 20, 'cart': 5},
+    'medium': {
+        'users': 500, 'recipes': 5000,
+        'follows': 20, 'favorites': 50, 'cart': 10},
+    'large': {
+        'users': 2000, 'recipes': 20000,
+        'follows': 50, 'favorites': 100, 'cart': 20},
+}
+RANDOM_SEED = 2022
+# Изменение p50 меньше этого (мс) - шум, а не замедление
+MIN_SLOWDOWN = 1.0
+INGREDIENTS_PER_RECIPE = 8
+TAGS = (
+    ('Завтрак', '#E26C2D', 'breakfast'),
+    ('Обед', '#49B64E', 'lunch'),
+    ('Ужин', '#8775D2', 'dinner'),
+)
+# Замеряемые запросы: (название, url). Запросы выполняет пользователь
+# с подписками, избранным и списком покупок, {author} - другой автор
+CASES = (
+    ('recipes', '/api/recipes/'),
+    ('recipes_cursor', '/api/recipes/?cursor='),
+    ('recipes_tags', '/api/recipes/?tags=breakfast&tags=lunch'),
+    ('recipes_author', '/api/recipes/?author={author}'),
+    ('recipes_popular', '/api/recipes/?ordering=popular'),
+    ('recipes_favorited', '/api/recipes/?is_favorited=1'),
+    ('recipes_in_cart', '/api/recipes/?is_in_shopping_cart=1'),
+    ('recipe_detail', '/api/recipes/{recipe}/'),
+    ('subscriptions', '/api/users/subscriptions/?recipes_limit=3'),
+    ('ingredients_search', '/api/ingredients/?name=сах'),
+    ('shopping_cart_pdf', '/api/recipes/download_shopping_cart/?type=pdf'),
+)
+
+
+class Command(BaseCommand):
+    """
+    Замер основных запросов api (RecipeSerializer, RecipeFilter,
+    FollowSerializer, download_shopping_cart) через тестовый клиент.
+    Данные заполняются в отдельной тестовой базе (как в manage.py test),
+    которая удаляется после замера; рабочая база не изменяется.
+    Каждый запрос выполняется --warmup раз без замера и --repeat раз
+    с замером: p50, p95 и число запросов к базе.
+    Результаты можно сохранить (--save) и сравнить с сохраненными
+    ранее (--baseline): команда завершается ошибкой, если p50 вырос
+    больше чем на --threshold процентов или запросов стало больше.
+    python manage.py benchmark --scale medium --save baseline.json
+    python manage.py benchmark --scale medium --baseline baseline.json
+    """
+
+    help = HELP_MESSAGE
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=SCALES, default='small')
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument(
+            '--ingredients', default=PATH_TO_JSON_FILES,
+            help='Файл ингридиентов (как в import_into_db).')
+        parser.add_argument('--baseline', help='Сравнить с файлом JSON.')
+        parser.add_argument('--save', help='Сохранить результаты в JSON.')
+        parser.add_argument(
+            '--threshold', type=float, default=20,
+            help='Допустимый рост p50, процентов.')
+
+    def handle(self, *args, **options):
+        if not os.path.exists(options['ingredients']):
+            raise CommandError(
+                NO_INGREDIENTS_ERROR.format(path=options['ingredients']))
+        with benchmark_database():
+            user, author, recipe = self.seed(
+                options['scale'], options['ingredients'])
+            results = self.run(user, author, recipe, **options)
+        old_results = {}
+        if options['baseline']:
+            with open(options['baseline'], encoding='utf-8') as file:
+                old_results = json.load(file).get(options['scale'], {})
+        for case, result in results.items():
+            old = old_results.get(case)
+            change = '' if old is None else CHANGE_MESSAGE.format(
+                p50=result['p50'] / old['p50'] - 1, queries=old['queries'])
+            self.stdout.write(
+                RESULT_MESSAGE.format(case=case, change=change, **result))
+        if options['save']:
+            self.save(options['save'], options['scale'], results)
+        regressions = self.compare(
+            results, old_results, options['threshold'])
+        for regression in regressions:
+            self.stderr.write(regression)
+        if regressions:
+            raise CommandError(REGRESSION_ERROR.format(
+                path=options['baseline'], count=len(regressions)))
+
+    def seed(self, scale, ingredients_path):
+        """
+        Заполнение тестовой базы bulk_create (сигналы не вызываются,
+        счетчики рецептов и избранного заполняются сразу).
+        Возвращает пользователя для запросов, автора и рецепт.
+        """
+        started = time.monotonic()
+        sizes = SCALES[scale]
+        rng = random.Random(RANDOM_SEED)
+        users_count, recipes_count = sizes['users'], sizes['recipes']
+        authors = [rng.randrange(users_count) for _ in range(recipes_count)]
+        favorites = [
+            rng.sample(range(recipes_count), sizes['favorites'])
+            for _ in range(users_count)]
+        recipes_counts = Counter(authors)
+        favorites_counts = Counter(
+            recipe for recipes in favorites for recipe in recipes)
+        User.objects.bulk_create(
+            User(
+                username=f'user{number}', email=f'user{number}@localhost',
+                first_name=f'Имя {number}', last_name=f'Фамилия {number}',
+                password='!', recipes_count=recipes_counts[number])
+            for number in range(users_count))
+        # bulk_create в SQLite не возвращает pk
+        users = list(User.objects.order_by('pk'))
+        tags = Tag.objects.bulk_create(
+            Tag(name=name, color=color, slug=slug)
+            for name, color, slug in TAGS)
+        tags = list(Tag.objects.order_by('pk'))
+        with open(ingredients_path, encoding='utf-8') as file:
+            Ingredient.objects.bulk_create(
+                Ingredient(**row) for row in json.load(file))
+        ingredients = list(Ingredient.objects.order_by('pk'))
+        Recipe.objects.bulk_create(
+            Recipe(
+                author=users[author], name=f'Рецепт {number}',
+                text=f'Описание рецепта {number}',
+                cooking_time=rng.randint(
+                    settings.MIN_COOKING_TIME, 120),
+                image=f'recipes/image/benchmark_{number % 10}.png',
+                favorites_count=favorites_counts[number])
+            for number, author in enumerate(authors))
+        recipes = list(Recipe.objects.order_by('pk'))
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                recipe=recipe, ingredient=ingredient,
+                count=rng.randint(1, 500))
+            for recipe in recipes
+            for ingredient in rng.sample(
+                ingredients, INGREDIENTS_PER_RECIPE))
+        RecipeTag.objects.bulk_create(
+            RecipeTag(recipe=recipe, tag=tag)
+            for recipe in recipes
+            for tag in rng.sample(tags, rng.randint(1, 2)))
+        Favorite.objects.bulk_create(
+            Favorite(user=user, recipe=recipes[recipe])
+            for user, user_recipes in zip(users, favorites)
+            for recipe in user_recipes)
+        ShoppingCart.objects.bulk_create(
+            ShoppingCart(user=user, recipe=recipe)
+            for user in users
+            for recipe in rng.sample(recipes, sizes['cart']))
+        Follow.objects.bulk_create(
+            Follow(user=user, author=author)
+            for number, user in enumerate(users)
+            for author in rng.sample(
+                users[:number] + users[number + 1:], sizes['follows']))
+        self.stdout.write(SEED_MESSAGE.format(
+            scale=scale, users=users_count, recipes=recipes_count,
+            ingredients=len(ingredients),
+            elapsed=time.monotonic() - started))
+        return users[0], users[1], recipes[0]
+
+    def run(self, user, author, recipe, warmup, repeat, **options):
+        token = Token.objects.create(user=user)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        host = get_host()
+        results = {}
+        for case, url in CASES:
+            url = url.format(author=author.username, recipe=recipe.pk)
+
+            def get():
+                response = client.get(url, HTTP_HOST=host)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+                return response
+
+            timings, queries = [], []
+            for number in range(warmup + repeat):
+                # Файл списка покупок формируется при каждом запросе,
+                # а не отдается из кеша
+                shutil.rmtree(
+                    settings.SHOPPING_LIST_CACHE_DIR, ignore_errors=True)
+                # Сборка мусора - между запросами, а не во время замера
+                gc.collect()
+                gc.disable()
+                try:
+                    response, elapsed, count = measure(get)
+                finally:
+                    gc.enable()
+                if response.status_code != 200:
+                    raise CommandError(RESPONSE_ERROR.format(
+                        case=case, status=response.status_code))
+                if number >= warmup:
+                    timings.append(elapsed)
+                    queries.append(count)
+            timings.sort()
+            results[case] = {
+                'p50': round(statistics.median(timings), 2),
+                'p95': round(percentile(timings, 0.95), 2),
+                'queries': max(queries),
+            }
+        return results
+
+    def save(self, path, scale, results):
+        """Результаты набора scale; остальные наборы в файле остаются."""
+        data = {}
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as file:
+                data = json.load(file)
+        data[scale] = results
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(data, file, ensure_ascii=False, indent=2)
+        self.stdout.write(SAVE_MESSAGE.format(path=path))
+
+    def compare(self, results, old_results, threshold):
+        """Запросы, которые стали медленнее или выполняют больше SQL."""
+        regressions = []
+        for case, result in results.items():
+            old = old_results.get(case)
+            if old is None:
+                continue
+            if (
+                result['p50'] > old['p50'] * (1 + threshold / 100)
+                and result['p50'] - old['p50'] > MIN_SLOWDOWN
+            ):
+                regressions.append(REGRESSION_MESSAGE.format(
+                    case=case, reason=SLOWER_REASON.format(
+                        old=old['p50'], new=result['p50'])))
+            if result['queries'] > old['queries']:
+                regressions.append(REGRESSION_MESSAGE.format(
+                    case=case, reason=QUERIES_REASON.format(
+                        old=old['queries'], new=result['queries'])))
+        return regressions
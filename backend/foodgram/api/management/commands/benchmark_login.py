@@ -0,0 +1,78 @@
+import statistics
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework import status
+from rest_framework.test import APIRequestFactory
+
+from api.benchmarking import (benchmark_database, get_host, measure,
+                              percentile)
+from api.views import CustomAuthToken
+from users.models import User
+
+HELP_MESSAGE = 'Замер пропускной способности входа (выдачи токена)'
+START_MESSAGE = 'Вход по email, повторов: {repeat}'
+RESULT_MESSAGE = (
+    '{case}: {throughput:.1f} входов/с; время, мс: медиана {median:.1f}, '
+    'p95 {p95:.1f}; запросов к базе: {queries}')
+RESPONSE_ERROR = '{case}: ответ {status} {data}'
+BENCHMARK_USERNAME = 'benchmark_login'
+BENCHMARK_PASSWORD = 'benchmark_login_password'
+# Случай: (пароль, ожидаемый статус ответа)
+CASES = {
+    'Верный пароль': (BENCHMARK_PASSWORD, status.HTTP_200_OK),
+    'Неверный пароль': ('wrong', status.HTTP_401_UNAUTHORIZED),
+}
+
+
+class Command(BaseCommand):
+    """
+    Замер POST /api/auth/token/login/ с верным и неверным паролем:
+    входов в секунду в одном процессе, задержка и число запросов.
+    Время почти целиком уходит на хеш пароля (PASSWORD_HASHERS),
+    поэтому хеш должен вычисляться один раз на вход.
+    Замер выполняется в отдельной тестовой базе, которая затем
+    удаляется; рабочая база не изменяется.
+    python manage.py benchmark_login --repeat 50
+    """
+
+    help = HELP_MESSAGE
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=50)
+
+    def handle(self, *args, **options):
+        self.stdout.write(START_MESSAGE.format(**options))
+        with benchmark_database():
+            user = User.objects.create_user(
+                username=BENCHMARK_USERNAME,
+                email=f'{BENCHMARK_USERNAME}@localhost',
+                password=BENCHMARK_PASSWORD)
+            for case, (password, expected) in CASES.items():
+                self.run(case, user, password, expected, options['repeat'])
+
+    def run(self, case, user, password, expected, repeat):
+        host = get_host()
+        factory = APIRequestFactory()
+        view = CustomAuthToken.as_view()
+        # Адрес в другом регистре: поиск без учета регистра
+        payload = {'email': user.email.upper(), 'password': password}
+        timings, queries = [], []
+        for _ in range(repeat):
+            request = factory.post(
+                '/api/auth/token/login/', payload, format='json',
+                HTTP_HOST=host)
+            response, elapsed, count = measure(lambda: view(request))
+            if response.status_code != expected:
+                raise CommandError(RESPONSE_ERROR.format(
+                    case=case, status=response.status_code,
+                    data=response.data))
+            timings.append(elapsed)
+            queries.append(count)
+        total = sum(timings)
+        timings.sort()
+        self.stdout.write(self.style.SUCCESS(RESULT_MESSAGE.format(
+            case=case,
+            throughput=len(timings) * 1000 / total,
+            median=statistics.median(timings),
+            p95=percentile(timings, 0.95),
+            queries=statistics.median_low(queries))))
@@ -0,0 +1,95 @@
+import statistics
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from rest_framework import status
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from api.benchmarking import (benchmark_database, get_host, measure,
+                              percentile)
+from api.views import RecipesViewSet
+from recipes.models import Ingredient, Tag
+from users.models import User
+
+HELP_MESSAGE = 'Замер времени создания рецепта через api'
+START_MESSAGE = (
+    'Создание рецепта с {ingredients} ингридиентами, повторов: {repeat}')
+RESULT_MESSAGE = (
+    'Время, мс: медиана {median:.1f}, p95 {p95:.1f}, '
+    'мин {min:.1f}, макс {max:.1f}; запросов к базе: {queries}')
+RESPONSE_ERROR = 'Рецепт не создан: {status} {data}'
+BENCHMARK_USERNAME = 'benchmark_recipe_write'
+# Картинка 1x1 пиксель: замеряется работа с базой, а не декодирование
+IMAGE = (
+    'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAA'
+    'DUlEQVR42mNkYPhfDwAChwGA60e6kgAAAABJRU5ErkJggg==')
+
+
+class Command(BaseCommand):
+    """
+    Замер задержки POST /api/recipes/ для рецепта с большим числом
+    ингридиентов (валидация, запись связей, ответ api).
+    Замер выполняется в отдельной тестовой базе, которая затем
+    удаляется; рабочая база не изменяется. Запросы выполняются в одной
+    транзакции, которая затем отменяется, поэтому COMMIT и хуки
+    on_commit (миниатюры, сброс кешей) в замер не входят.
+    python manage.py benchmark_recipe_write --ingredients 50 --repeat 20
+    """
+
+    help = HELP_MESSAGE
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ingredients', type=int, default=50)
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        self.stdout.write(START_MESSAGE.format(**options))
+        with benchmark_database():
+            with transaction.atomic():
+                timings, queries = self.run(**options)
+                # Хуки on_commit не выполняются
+                transaction.set_rollback(True)
+        timings.sort()
+        self.stdout.write(self.style.SUCCESS(RESULT_MESSAGE.format(
+            median=statistics.median(timings),
+            p95=percentile(timings, 0.95),
+            min=timings[0],
+            max=timings[-1],
+            queries=max(queries))))
+
+    def run(self, ingredients, repeat, **options):
+        Ingredient.objects.bulk_create(
+            Ingredient(
+                name=f'{BENCHMARK_USERNAME}_{number}', measurement_unit='г')
+            for number in range(ingredients))
+        ingredient_ids = list(Ingredient.objects.values_list('pk', flat=True))
+        tag = Tag.objects.create(
+            name=BENCHMARK_USERNAME, color='#000000', slug=BENCHMARK_USERNAME)
+        author = User.objects.create_user(
+            username=BENCHMARK_USERNAME,
+            email=f'{BENCHMARK_USERNAME}@localhost')
+        payload = {
+            'ingredients': [
+                {'id': pk, 'amount': 1} for pk in ingredient_ids],
+            'tags': [tag.pk],
+            'image': IMAGE,
+            'name': BENCHMARK_USERNAME,
+            'text': BENCHMARK_USERNAME,
+            'cooking_time': settings.MIN_COOKING_TIME,
+        }
+        host = get_host()
+        factory = APIRequestFactory()
+        view = RecipesViewSet.as_view({'post': 'create'})
+        timings, queries = [], []
+        for _ in range(repeat):
+            request = factory.post(
+                '/api/recipes/', payload, format='json', HTTP_HOST=host)
+            force_authenticate(request, user=author)
+            response, elapsed, count = measure(lambda: view(request))
+            if response.status_code != status.HTTP_201_CREATED:
+                raise CommandError(RESPONSE_ERROR.format(
+                    status=response.status_code, data=response.data))
+            timings.append(elapsed)
+            queries.append(count)
+        return timings, queries
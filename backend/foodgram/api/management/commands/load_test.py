@@ -0,0 +1,394 @@
+import asyncio
+import json
+import math
+import random
+import ssl
+import time
+from collections import Counter
+from urllib.parse import urlencode, urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+HELP_MESSAGE = 'Нагрузочное тестирование запущенного сервера api'
+START_MESSAGE = (
+    'Нагрузка на {url}: {concurrency} клиентов, {duration} с, '
+    'сценарии {mix}')
+RESULT_MESSAGE = (
+    'Запросов {requests} за {elapsed:.1f} с: {throughput:.1f} в секунду, '
+    'ошибок {errors} ({error_rate:.1%})')
+HEADER_MESSAGE = (
+    '{label:<44} {requests:>7} {rps:>7} {errors:>6} '
+    '{p50:>7} {p95:>7} {p99:>7} {max:>7}')
+ROW_MESSAGE = (
+    '{label:<44} {requests:>7} {rps:>7.1f} {error_rate:>6.1%} '
+    '{p50:>7.1f} {p95:>7.1f} {p99:>7.1f} {max:>7.1f}')
+HISTOGRAM_MESSAGE = '  {buckets}'
+STATUSES_MESSAGE = '  ошибки: {statuses}'
+MIX_ERROR = 'Сценарий должен быть в виде имя=вес: {item}'
+SCENARIO_ERROR = 'Нет сценария {name}, есть: {names}'
+SETUP_ERROR = 'Клиент {username} не вошел: {status} {body}'
+CONNECTION_ERROR = 'Сервер {url} недоступен: {error!r}'
+NO_RECIPES_ERROR = 'На сервере нет рецептов: сценарии с рецептами невозможны'
+DEFAULT_MIX = 'browse=50,autocomplete=20,toggle=15,download=5,login=10'
+# Пользователи нагрузки: load_test_0, load_test_1, ... (по одному на
+# клиента, поэтому избранное и покупки разных клиентов не пересекаются)
+USERNAME = 'load_test_{number}'
+PASSWORD = 'load_test_password'
+# Границы корзин гистограммы задержек, мс
+HISTOGRAM_BUCKETS = (10, 25, 50, 100, 250, 500, 1000, 2500)
+# Набор названия ингридиента по буквам (автодополнение в форме рецепта)
+INGREDIENT_NAMES = ('сахар', 'молоко', 'мука', 'яйца', 'соль', 'томаты')
+EMPTY_LINES = (b'\r\n', b'\n', b'')
+
+
+class HttpConnection:
+    """Соединение HTTP/1.1 с keep-alive поверх asyncio streams."""
+
+    def __init__(self, url, ssl_context, timeout):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or (443 if parts.scheme == 'https' else 80)
+        self.host_header = parts.netloc
+        self.ssl = ssl_context if parts.scheme == 'https' else None
+        self.timeout = timeout
+        self.reader = self.writer = None
+
+    async def request(self, method, path, data=None, token=None):
+        """(статус, тело ответа)."""
+        try:
+            return await asyncio.wait_for(
+                self.send(method, path, data, token), self.timeout)
+        except BaseException:
+            # Ответ не дочитан: соединение больше не годится
+            self.close()
+            raise
+
+    async def send(self, method, path, data, token):
+        body = b'' if data is None else json.dumps(data).encode()
+        lines = [
+            f'{method} {path} HTTP/1.1',
+            f'Host: {self.host_header}',
+            'Accept: application/json',
+            f'Content-Length: {len(body)}',
+        ]
+        if data is not None:
+            lines.append('Content-Type: application/json')
+        if token is not None:
+            lines.append(f'Authorization: Token {token}')
+        message = ('\r\n'.join(lines) + '\r\n\r\n').encode() + body
+        reused = self.writer is not None
+        if not reused:
+            await self.connect()
+        try:
+            status_line = await self.write(message)
+        except ConnectionError:
+            if not reused:
+                raise
+            # Сервер закрыл простаивавшее соединение: повтор на новом
+            await self.connect()
+            status_line = await self.write(message)
+        status = int(status_line.split()[1])
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in EMPTY_LINES:
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        if status in (204, 304) or method == 'HEAD':
+            content = b''
+        elif headers.get('transfer-encoding', '').lower() == 'chunked':
+            content = await self.read_chunked()
+        elif 'content-length' in headers:
+            content = await self.reader.readexactly(
+                int(headers['content-length']))
+        else:
+            content = await self.reader.read()
+            headers['connection'] = 'close'
+        if headers.get('connection', '').lower() == 'close':
+            self.close()
+        return status, content
+
+    async def write(self, message):
+        """Отправить запрос и прочитать строку статуса ответа."""
+        self.writer.write(message)
+        await self.writer.drain()
+        status_line = await self.reader.readline()
+        if not status_line:
+            self.close()
+            raise ConnectionResetError
+        return status_line
+
+    async def read_chunked(self):
+        chunks = []
+        while True:
+            size = int((await self.reader.readline()).split(b';')[0], 16)
+            if not size:
+                break
+            chunks.append(await self.reader.readexactly(size))
+            await self.reader.readexactly(2)
+        # Завершающие заголовки (trailer) до пустой строки
+        while await self.reader.readline() not in EMPTY_LINES:
+            pass
+        return b''.join(chunks)
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.open_connection(
+            self.host, self.port, ssl=self.ssl)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+class Client:
+    """Клиент нагрузки: свое соединение и свой пользователь."""
+
+    def __init__(self, number, connection):
+        self.username = USERNAME.format(number=number)
+        self.email = f'{self.username}@localhost'
+        self.connection = connection
+        self.token = None
+        self.rng = random.Random(number)
+
+
+class EndpointStats:
+    """Задержки (мс) и ошибки запросов одного вида."""
+
+    def __init__(self):
+        self.latencies = []
+        self.errors = Counter()
+
+    def percentile(self, value):
+        if not self.latencies:
+            return 0.0
+        return self.latencies[
+            max(math.ceil(len(self.latencies) * value) - 1, 0)]
+
+    def histogram(self):
+        """Доля запросов по корзинам HISTOGRAM_BUCKETS."""
+        counts = Counter()
+        for latency in self.latencies:
+            counts[next(
+                (bucket for bucket in HISTOGRAM_BUCKETS if latency <= bucket),
+                None)] += 1
+        total = len(self.latencies) or 1
+        return '  '.join(
+            f'≤{bucket}:{counts[bucket] / total:.0%}'
+            for bucket in HISTOGRAM_BUCKETS
+        ) + f'  >{HISTOGRAM_BUCKETS[-1]}:{counts[None] / total:.0%}'
+
+
+class Command(BaseCommand):
+    """
+    Нагрузка на запущенный сервер (gunicorn за nginx или runserver)
+    смесью сценариев: --concurrency клиентов одновременно в течение
+    --duration секунд, у каждого клиента свое keep-alive соединение
+    и свой пользователь (load_test_N, создается при первом запуске).
+    Сценарии (--mix имя=вес):
+    browse - анонимный просмотр списка рецептов и рецепта;
+    autocomplete - поиск ингридиента по мере набора названия;
+    toggle - добавление и удаление рецепта в избранном и в покупках;
+    download - скачивание списка покупок;
+    login - вход по email и паролю.
+    Отчет по каждому виду запроса: число, запросов в секунду, доля
+    ошибок, p50 / p95 / p99 / максимум (мс) и гистограмма задержек.
+    python manage.py load_test --url http://127.0.0.1:8000 \\
+        --concurrency 20 --duration 30
+    python manage.py load_test --mix browse=80,login=20
+    """
+
+    help = HELP_MESSAGE
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000')
+        parser.add_argument('--concurrency', type=int, default=20)
+        parser.add_argument('--duration', type=float, default=30)
+        parser.add_argument('--mix', default=DEFAULT_MIX)
+        parser.add_argument(
+            '--timeout', type=float, default=30,
+            help='Время ожидания ответа, секунд.')
+        parser.add_argument(
+            '--insecure', action='store_true',
+            help='Не проверять сертификат https (localhost).')
+
+    def handle(self, *args, **options):
+        self.mix = self.parse_mix(options['mix'])
+        self.stdout.write(START_MESSAGE.format(**options))
+        ssl_context = ssl.create_default_context()
+        if options['insecure']:
+            ssl_context.check_hostname = False
+            ssl_context.verify_mode = ssl.CERT_NONE
+        self.stats = {}
+        elapsed = asyncio.run(self.run(ssl_context, **options))
+        self.report(elapsed)
+
+    def parse_mix(self, value):
+        mix = {}
+        for item in value.split(','):
+            name, _, weight = item.partition('=')
+            try:
+                mix[name.strip()] = float(weight)
+            except ValueError:
+                raise CommandError(MIX_ERROR.format(item=item))
+            if name.strip() not in self.scenarios:
+                raise CommandError(SCENARIO_ERROR.format(
+                    name=name, names=', '.join(self.scenarios)))
+        return {name: weight for name, weight in mix.items() if weight > 0}
+
+    async def run(self, ssl_context, url, concurrency, duration, timeout,
+                  **options):
+        clients = [
+            Client(number, HttpConnection(url, ssl_context, timeout))
+            for number in range(concurrency)
+        ]
+        # Подготовка (вход, список рецептов) в замер не входит
+        try:
+            await asyncio.gather(
+                *(self.sign_in(client) for client in clients))
+            await self.load_recipes(clients[0])
+        except (OSError, asyncio.TimeoutError) as error:
+            raise CommandError(CONNECTION_ERROR.format(url=url, error=error))
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        deadline = started + duration
+        await asyncio.gather(
+            *(self.work(client, deadline) for client in clients))
+        for client in clients:
+            client.connection.close()
+        return loop.time() - started
+
+    async def sign_in(self, client):
+        """Вход пользователя клиента; при первом запуске - регистрация."""
+        credentials = {'email': client.email, 'password': PASSWORD}
+        status, body = await client.connection.request(
+            'POST', '/api/auth/token/login/', credentials)
+        if status != 200:
+            await client.connection.request('POST', '/api/users/', {
+                'username': client.username, 'first_name': client.username,
+                'last_name': client.username, **credentials})
+            status, body = await client.connection.request(
+                'POST', '/api/auth/token/login/', credentials)
+        if status != 200:
+            raise CommandError(SETUP_ERROR.format(
+                username=client.username, status=status, body=body[:200]))
+        client.token = json.loads(body)['auth_token']
+
+    async def load_recipes(self, client):
+        """Рецепты первой страницы и число страниц списка."""
+        status, body = await client.connection.request('GET', '/api/recipes/')
+        page = json.loads(body)
+        self.recipe_ids = [recipe['id'] for recipe in page['results']]
+        if not self.recipe_ids and set(self.mix) & {'browse', 'toggle'}:
+            raise CommandError(NO_RECIPES_ERROR)
+        self.pages = max(
+            math.ceil(page['count'] / (len(self.recipe_ids) or 1)), 1)
+
+    async def work(self, client, deadline):
+        loop = asyncio.get_running_loop()
+        names, weights = list(self.mix), list(self.mix.values())
+        while loop.time() < deadline:
+            scenario = client.rng.choices(names, weights)[0]
+            await self.scenarios[scenario](self, client)
+
+    async def call(self, client, label, method, path, expected=200,
+                   data=None, anonymous=False):
+        """
+        Запрос с замером. Ошибка - исключение (соединение, таймаут)
+        или статус, отличный от expected. Возвращает тело ответа
+        или None при ошибке.
+        """
+        stats = self.stats.setdefault(label, EndpointStats())
+        started = time.perf_counter()
+        try:
+            status, body = await client.connection.request(
+                method, path, data, None if anonymous else client.token)
+        except (OSError, EOFError, ValueError, asyncio.TimeoutError) as error:
+            status, body = type(error).__name__, None
+        stats.latencies.append((time.perf_counter() - started) * 1000)
+        if status != expected:
+            stats.errors[status] += 1
+            return None
+        return body
+
+    async def browse(self, client):
+        body = await self.call(
+            client, 'GET /api/recipes/?page=', 'GET',
+            '/api/recipes/?' + urlencode(
+                {'page': client.rng.randint(1, self.pages)}),
+            anonymous=True)
+        recipes = json.loads(body)['results'] if body else ()
+        recipe_id = (
+            client.rng.choice(recipes)['id'] if recipes
+            else client.rng.choice(self.recipe_ids))
+        await self.call(
+            client, 'GET /api/recipes/{id}/', 'GET',
+            f'/api/recipes/{recipe_id}/', anonymous=True)
+
+    async def autocomplete(self, client):
+        name = client.rng.choice(INGREDIENT_NAMES)
+        for length in range(1, len(name) + 1):
+            await self.call(
+                client, 'GET /api/ingredients/?name=', 'GET',
+                '/api/ingredients/?' + urlencode({'name': name[:length]}))
+
+    async def toggle(self, client):
+        recipe_id = client.rng.choice(self.recipe_ids)
+        for relation in ('favorite', 'shopping_cart'):
+            path = f'/api/recipes/{recipe_id}/{relation}/'
+            label = f'/api/recipes/{{id}}/{relation}/'
+            await self.call(client, 'POST ' + label, 'POST', path, 201)
+            await self.call(client, 'DELETE ' + label, 'DELETE', path, 204)
+
+    async def download(self, client):
+        await self.call(
+            client, 'GET /api/recipes/download_shopping_cart/', 'GET',
+            '/api/recipes/download_shopping_cart/')
+
+    async def login(self, client):
+        body = await self.call(
+            client, 'POST /api/auth/token/login/', 'POST',
+            '/api/auth/token/login/',
+            data={'email': client.email, 'password': PASSWORD},
+            anonymous=True)
+        if body:
+            client.token = json.loads(body)['auth_token']
+
+    scenarios = {
+        'browse': browse,
+        'autocomplete': autocomplete,
+        'toggle': toggle,
+        'download': download,
+        'login': login,
+    }
+
+    def report(self, elapsed):
+        requests = sum(len(stats.latencies) for stats in self.stats.values())
+        errors = sum(
+            sum(stats.errors.values()) for stats in self.stats.values())
+        self.stdout.write(RESULT_MESSAGE.format(
+            requests=requests, elapsed=elapsed,
+            throughput=requests / elapsed, errors=errors,
+            error_rate=errors / (requests or 1)))
+        self.stdout.write(HEADER_MESSAGE.format(
+            label='Запрос', requests='всего', rps='в сек', errors='ошибки',
+            p50='p50 мс', p95='p95 мс', p99='p99 мс', max='макс'))
+        for label, stats in sorted(self.stats.items()):
+            stats.latencies.sort()
+            count = len(stats.latencies)
+            errors = sum(stats.errors.values())
+            row = ROW_MESSAGE.format(
+                label=label, requests=count, rps=count / elapsed,
+                error_rate=errors / (count or 1),
+                p50=stats.percentile(0.5), p95=stats.percentile(0.95),
+                p99=stats.percentile(0.99), max=stats.percentile(1))
+            self.stdout.write(
+                self.style.ERROR(row) if errors else row)
+            self.stdout.write(
+                HISTOGRAM_MESSAGE.format(buckets=stats.histogram()))
+            if errors:
+                self.stdout.write(STATUSES_MESSAGE.format(
+                    statuses=', '.join(
+                        f'{status}: {count}'
+                        for status, count in stats.errors.most_common())))
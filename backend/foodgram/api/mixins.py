@@ -0,0 +1,169 @@
+import hashlib
+
+from django.conf import settings
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+from api.cache import LRUCache
+from api.recipe_cache import get_cache_key, recipe_list_cache
+from api.relations import get_relations
+from api.versions import (INGREDIENTS_VERSION, TAGS_VERSION, bump_version,
+                          get_version)
+
+
+def is_not_modified(request, etag, last_modified=None):
+    """Проверка заголовков If-None-Match / If-Modified-Since запроса."""
+    return get_conditional_response(
+        request, etag=etag, last_modified=last_modified) is not None
+
+
+class CatalogCacheMixin:
+    """
+    Кеширование ответов справочника в памяти процесса.
+    Справочник меняется только через админку или команду импорта,
+    поэтому ответ зависит лишь от строки запроса и версии данных
+    catalog_version (см. api/versions.py, обновляется сигналами).
+    Поддерживаются условные запросы: If-None-Match / If-Modified-Since
+    получают ответ 304 без запросов к базе и сериализации.
+    """
+
+    catalog_version = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # Отдельный кеш для каждого справочника
+        cls.catalog_cache = LRUCache(
+            settings.CATALOG_CACHE_SIZE, settings.CATALOG_CACHE_TTL)
+
+    def list(self, request, *args, **kwargs):
+        return self.get_cached_response(
+            super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.get_cached_response(
+            super().retrieve, request, *args, **kwargs)
+
+    def get_cached_response(self, handler, request, *args, **kwargs):
+        version = (
+            get_version(self.catalog_version)
+            or bump_version(self.catalog_version))
+        etag = quote_etag(f'{version}-{request.accepted_renderer.format}')
+        last_modified = version // 10 ** 9
+        if is_not_modified(request, etag, last_modified):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            key = (version, request.get_full_path())
+            data = self.catalog_cache.get(key)
+            if data is None:
+                response = handler(request, *args, **kwargs)
+                if response.status_code != status.HTTP_200_OK:
+                    return response
+                self.catalog_cache.set(key, response.data)
+            else:
+                response = Response(data)
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        return response
+
+
+class ConditionalRecipeMixin:
+    """
+    Условные запросы к рецептам (list и retrieve).
+    ETag вычисляется по данным, которые уже загружены для ответа:
+    id и updated_at рецептов, данные авторов, флаги текущего пользователя
+    (избранное, список покупок, подписка), версии справочников и данные
+    пагинации. При совпадении с If-None-Match возвращается 304
+    без запуска сериализатора.
+    Last-Modified (наибольший updated_at) передается для информации:
+    флаги пользователя и состав страницы меняются без изменения рецептов,
+    поэтому If-Modified-Since не проверяется.
+    """
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        recipes = list(self.paginate_queryset(queryset))
+        # Данные пагинации (count, next, previous) без сериализации
+        pagination = self.paginator.get_paginated_response(None).data
+        etag = self.get_recipes_etag(recipes, list(pagination.items()))
+        if is_not_modified(request, etag):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            serializer = self.get_serializer(recipes, many=True)
+            response = self.get_paginated_response(serializer.data)
+        return self.set_validators(response, recipes, etag)
+
+    def retrieve(self, request, *args, **kwargs):
+        recipe = self.get_object()
+        etag = self.get_recipes_etag([recipe])
+        if is_not_modified(request, etag):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = Response(self.get_serializer(recipe).data)
+        return self.set_validators(response, [recipe], etag)
+
+    def get_recipes_etag(self, recipes, *extra):
+        relations = get_relations(self.request)
+        relations.load_recipes(recipe.id for recipe in recipes)
+        relations.load_authors(recipe.author_id for recipe in recipes)
+        state = [
+            (
+                recipe.id, recipe.updated_at.isoformat(),
+                recipe.author.email, recipe.author.username,
+                recipe.author.first_name, recipe.author.last_name,
+                relations.is_favorited(recipe.id),
+                relations.is_in_shopping_cart(recipe.id),
+                relations.is_subscribed(recipe.author_id)
+            )
+            for recipe in recipes
+        ]
+        key = repr((
+            self.request.user.id,
+            self.request.accepted_renderer.format,
+            get_version(INGREDIENTS_VERSION),
+            get_version(TAGS_VERSION),
+            extra,
+            state
+        ))
+        return quote_etag(hashlib.md5(key.encode()).hexdigest())
+
+    def set_validators(self, response, recipes, etag):
+        response['ETag'] = etag
+        if recipes:
+            response['Last-Modified'] = http_date(max(
+                recipe.updated_at for recipe in recipes).timestamp())
+        return response
+
+
+class RecipeListCacheMixin:
+    """
+    Кеш страниц списка рецептов для анонимных пользователей
+    (см. api/recipe_cache.py). Вместе с данными хранятся ETag
+    и Last-Modified, поэтому при попадании в кеш запросов к базе нет.
+    Заголовок X-Cache: HIT / MISS.
+    """
+
+    def list(self, request, *args, **kwargs):
+        if request.user.is_authenticated:
+            return super().list(request, *args, **kwargs)
+        key = get_cache_key(request)
+        cached = recipe_list_cache.get(key)
+        if cached is None:
+            response = super().list(request, *args, **kwargs)
+            if response.status_code == status.HTTP_200_OK:
+                recipe_list_cache.set(key, (
+                    response.data, response['ETag'],
+                    response.get('Last-Modified')))
+            response['X-Cache'] = 'MISS'
+            return response
+        data, etag, last_modified = cached
+        if is_not_modified(request, etag):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = Response(data)
+        response['ETag'] = etag
+        if last_modified:
+            response['Last-Modified'] = last_modified
+        response['X-Cache'] = 'HIT'
+        return response
@@ -1,12 +1,45 @@
 from django.conf import settings
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+class CustomCursorPagination(CursorPagination):
+    """
+    Курсорная пагинация по полям ordering.
+    Не выполняет OFFSET и COUNT(*), страницы не сдвигаются
+    при добавлении новых объектов.
+    """
+
+    page_size_query_param = 'limit'
+    page_size = settings.PAGE_SIZE
+
+    def __init__(self, ordering):
+        self.ordering = ordering
 
 
 class CustomPagination(PageNumberPagination):
     """
     Собственный пагинатор.
     Client can control the page size using <page_size_query_param>.
+    Если в запросе передан параметр cursor (для первой страницы - пустой),
+    используется курсорная пагинация по полям view.cursor_ordering:
+    GET http://127.0.0.1:8000/api/recipes/?cursor=&limit=10
+    Ссылки next и previous ответа содержат непрозрачный курсор.
     """
 
     page_size_query_param = 'limit'
     page_size = settings.PAGE_SIZE
+    cursor_query_param = 'cursor'
+    cursor_paginator = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        ordering = getattr(view, 'cursor_ordering', None)
+        if ordering and self.cursor_query_param in request.query_params:
+            self.cursor_paginator = CustomCursorPagination(ordering)
+            return self.cursor_paginator.paginate_queryset(
+                queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
@@ -0,0 +1,81 @@
+"""
+Кеш страниц списка рецептов для анонимных пользователей.
+Ключ - нормализованные параметры запроса (page, limit, cursor, tags,
+author, ordering) и версии данных, от которых зависит страница:
+- страница с фильтром по автору - только от рецептов этого автора;
+- остальные страницы - от всех рецептов;
+- страницы с ordering=popular - еще и от избранного;
+- страницы с фильтром по автору - еще и от общей версии авторов,
+  которая меняется, когда рецепты изменены без загрузки автора
+  (каскадное удаление вместе с автором, удаление списком в админке);
+- все страницы - от справочников тегов и ингридиентов.
+"""
+import hashlib
+
+from django.conf import settings
+
+from api.cache import LRUCache
+from api.versions import (INGREDIENTS_VERSION, TAGS_VERSION, bump_version,
+                          get_version)
+
+RECIPES_VERSION = 'recipes'
+FAVORITES_VERSION = 'recipes-favorites'
+ALL_AUTHORS_VERSION = 'recipes-all-authors'
+
+recipe_list_cache = LRUCache(
+    settings.RECIPE_LIST_CACHE_SIZE, settings.RECIPE_LIST_CACHE_TTL)
+
+
+def get_author_version(username):
+    # В имени файла-метки не должно быть произвольных символов username
+    return 'recipes-author-' + hashlib.md5(username.encode()).hexdigest()
+
+
+def get_cache_key(request):
+    params = request.query_params
+    author = params.get('author')
+    ordering = params.get('ordering')
+    if author:
+        recipes_version = (
+            get_version(get_author_version(author)),
+            get_version(ALL_AUTHORS_VERSION))
+    else:
+        recipes_version = get_version(RECIPES_VERSION)
+    return (
+        request.get_host(),
+        request.accepted_renderer.format,
+        params.get('page') or '1',
+        params.get('limit') or str(settings.PAGE_SIZE),
+        params.get('cursor'),
+        tuple(sorted(set(params.getlist('tags')))),
+        author,
+        ordering,
+        recipes_version,
+        get_version(FAVORITES_VERSION) if ordering else 0,
+        get_version(INGREDIENTS_VERSION),
+        get_version(TAGS_VERSION),
+    )
+
+
+def invalidate(*usernames):
+    """
+    Рецепты авторов usernames изменились: устаревают страницы без фильтра
+    по автору и страницы с фильтром по этим авторам.
+    """
+    bump_version(RECIPES_VERSION)
+    for username in set(usernames):
+        bump_version(get_author_version(username))
+
+
+def invalidate_all_authors():
+    """
+    Изменились рецепты неизвестных авторов: устаревают все страницы
+    (одна метка вместо запроса username для каждого рецепта).
+    """
+    bump_version(RECIPES_VERSION)
+    bump_version(ALL_AUTHORS_VERSION)
+
+
+def invalidate_favorites():
+    """Изменилось избранное: устаревают страницы с ordering=popular."""
+    bump_version(FAVORITES_VERSION)
@@ -0,0 +1,79 @@
+"""Связи текущего пользователя, загружаемые один раз на запрос."""
+from recipes.models import Favorite, ShoppingCart
+from users.models import Follow
+
+
+class RelatedIds:
+    """
+    Множество id объектов, связанных с текущим пользователем.
+    Из базы запрашиваются только те id, которые еще не проверялись.
+    """
+
+    def __init__(self, queryset, field):
+        self.queryset = queryset
+        self.field = field
+        self.checked = set()
+        self.found = set()
+
+    def load(self, ids):
+        """Одним запросом проверить все новые id."""
+        ids = set(ids) - self.checked
+        if not ids:
+            return
+        self.found.update(self.queryset.filter(
+            **{f'{self.field}__in': ids}
+        ).values_list(self.field, flat=True))
+        self.checked.update(ids)
+
+    def __contains__(self, pk):
+        self.load((pk,))
+        return pk in self.found
+
+
+class UserRelations:
+    """
+    Подписки, избранное и список покупок текущего пользователя.
+    Используется сериализаторами для полей is_subscribed, is_favorited
+    и is_in_shopping_cart вместо отдельного запроса на каждый объект.
+    """
+
+    def __init__(self, user):
+        self.user = user
+        if user.is_anonymous:
+            return
+        self.following = RelatedIds(
+            Follow.objects.filter(user=user), 'author_id')
+        self.favorites = RelatedIds(
+            Favorite.objects.filter(user=user), 'recipe_id')
+        self.cart = RelatedIds(
+            ShoppingCart.objects.filter(user=user), 'recipe_id')
+
+    def load_authors(self, ids):
+        if self.user.is_authenticated:
+            self.following.load(ids)
+
+    def load_recipes(self, ids):
+        if self.user.is_authenticated:
+            ids = set(ids)
+            self.favorites.load(ids)
+            self.cart.load(ids)
+
+    def is_subscribed(self, author_id):
+        if self.user.is_anonymous or self.user.id == author_id:
+            return False
+        return author_id in self.following
+
+    def is_favorited(self, recipe_id):
+        return self.user.is_authenticated and recipe_id in self.favorites
+
+    def is_in_shopping_cart(self, recipe_id):
+        return self.user.is_authenticated and recipe_id in self.cart
+
+
+def get_relations(request):
+    """Связи пользователя, один объект на весь запрос."""
+    relations = getattr(request, 'user_relations', None)
+    if relations is None:
+        relations = UserRelations(request.user)
+        request.user_relations = relations
+    return relations
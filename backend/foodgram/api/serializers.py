@@ -1,37 +1,139 @@
 import base64
+import binascii
+import hashlib
+import json
 
 from api.constants import (BAD_USERNAME_ERROR, CREATE_SHOPPING_CART_ERROR,
                            CREATE_SHOPPING_CART_EXIST_ERROR,
-                           FOLLOW_EXIST_ERROR, FOLLOW_YOURSELF_ERROR,
+                           EMAIL_EXIST_ERROR, FOLLOW_EXIST_ERROR,
+                           FOLLOW_YOURSELF_ERROR,
+                           IMAGE_FORMAT_ERROR, IMAGE_SIZE_ERROR,
                            INGREDIENT_AMOUNT_ERROR, INGREDIENT_COUNT_MAX_ERROR,
                            INGREDIENT_COUNT_MIN_ERROR, INGREDIENT_ID_ERROR,
                            INGREDIENT_NAME_ERROR, LIMIT_NAME_ERROR,
-                           TAG_ID_ERROR, TAG_NAME_ERROR, VALIDATION_ERROR)
+                           NOT_FOUND_ERROR, TAG_ID_ERROR, TAG_NAME_ERROR,
+                           VALIDATION_ERROR)
+from api.relations import get_relations
 from django.conf import settings
 from django.core.files.base import ContentFile
-from django.shortcuts import get_object_or_404
-from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
-                            RecipeTag, ShoppingCart, Tag)
+from django.db import transaction
+from django.db.models import Manager
+from jobs.models import Job
+from recipes.models import (Ingredient, Recipe, RecipeIngredient, RecipeTag,
+                            ShoppingCart, Tag)
+from recipes.thumbnails import get_thumbnail_urls
+from rest_framework.exceptions import NotFound
 from rest_framework.serializers import (CharField, ImageField, IntegerField,
-                                        ModelSerializer,
+                                        ListSerializer, ModelSerializer,
                                         PrimaryKeyRelatedField, Serializer,
                                         SerializerMethodField,
                                         StringRelatedField, ValidationError)
+from rest_framework.validators import UniqueValidator
 
 from users.models import Follow, User
 
 
+def get_objects_or_404(model, ids):
+    """
+    Объекты model с первичными ключами ids одним запросом IN.
+    Если хотя бы одного нет - 404, как у get_object_or_404.
+    """
+    objects = model.objects.in_bulk(ids)
+    if len(objects) < len(set(ids)):
+        raise NotFound({'error': NOT_FOUND_ERROR.format(
+            name=model._meta.verbose_name,
+            ids=sorted(set(ids) - set(objects)))})
+    return objects
+
+
+def is_same_file(current, new):
+    """Совпадает ли загруженный файл new с сохраненным файлом current."""
+    current_hash, new_hash = hashlib.sha256(), hashlib.sha256()
+    try:
+        if not current or current.size != new.size:
+            return False
+        with current.open('rb'):
+            for chunk in current.chunks():
+                current_hash.update(chunk)
+    except OSError:
+        # Файла нет в хранилище: сохранить новый
+        return False
+    for chunk in new.chunks():
+        new_hash.update(chunk)
+    return current_hash.digest() == new_hash.digest()
+
+
 class Base64ImageField(ImageField):
-    """Создание кастомного поля для сериализатора."""
+    """
+    Создание кастомного поля для сериализатора.
+    Размер проверяется по длине строки до декодирования base64.
+    """
 
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith('data:image'):
-            format, imgstr = data.split(';base64,')
+            if ';base64,' not in data:
+                raise ValidationError(IMAGE_FORMAT_ERROR)
+            format, imgstr = data.split(';base64,', 1)
+            # 4 символа base64 - 3 байта
+            if len(imgstr) * 3 // 4 > settings.MAX_IMAGE_SIZE:
+                raise ValidationError(IMAGE_SIZE_ERROR)
+            try:
+                content = base64.b64decode(imgstr, validate=True)
+            except binascii.Error:
+                raise ValidationError(IMAGE_FORMAT_ERROR)
             ext = format.split('/')[-1]
-            data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
+            data = ContentFile(content, name='temp.' + ext)
         return super().to_internal_value(data)
 
 
+class ThumbnailMixin:
+    """
+    Поле thumbnails: ссылки на миниатюры картинки (WebP и JPEG).
+    Если миниатюры готовы и задан размер get_thumbnail_size,
+    поле image ссылается на JPEG миниатюру вместо оригинала.
+    """
+
+    def get_thumbnail_size(self):
+        return None
+
+    def get_thumbnails(self, obj):
+        """Вычисление поля thumbnails (null, пока миниатюры не готовы)."""
+        thumbnails = get_thumbnail_urls(obj)
+        if thumbnails is None:
+            return None
+        request = self.context.get('request')
+        if request is None:
+            return thumbnails
+        return {
+            size: {
+                extension: request.build_absolute_uri(url)
+                for extension, url in urls.items()
+            }
+            for size, urls in thumbnails.items()
+        }
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        size = self.get_thumbnail_size()
+        if size and data.get('thumbnails'):
+            data['image'] = data['thumbnails'][size]['jpeg']
+        return data
+
+
+class RelationListSerializer(ListSerializer):
+    """
+    Список объектов, связи которых с текущим пользователем
+    загружаются сразу для всей страницы (см. api/relations.py).
+    """
+
+    def to_representation(self, data):
+        items = list(data.all() if isinstance(data, Manager) else data)
+        request = self.context.get('request')
+        if request is not None:
+            self.child.load_relations(get_relations(request), items)
+        return super().to_representation(items)
+
+
 class UserSerializerExtended(ModelSerializer):
     """Сериализатор для модели User (добавляется поле is_subscribed)."""
 
@@ -42,6 +144,10 @@ class UserSerializerExtended(ModelSerializer):
         fields = (
             'email', 'id', 'username', 'first_name', 'last_name',
             'is_subscribed')
+        list_serializer_class = RelationListSerializer
+
+    def load_relations(self, relations, users):
+        relations.load_authors(user.id for user in users)
 
     def get_is_subscribed(self, obj):
         """
@@ -51,10 +157,7 @@ class UserSerializerExtended(ModelSerializer):
         # Проверка для роута /api/users/me/
         if not self.context:
             return False
-        user = self.context.get('view').request.user
-        if user.is_anonymous or (user == obj):
-            return False
-        return Follow.objects.filter(user=user, author=obj).exists()
+        return get_relations(self.context['request']).is_subscribed(obj.id)
 
 
 class UserSerializer(ModelSerializer):
@@ -79,6 +182,10 @@ class UserCreateSerializer(ModelSerializer):
         # Исключить пароли из данных, читаемых в базе данных
         extra_kwargs = {
             "password": {"write_only": True},
+            # Вход по email не учитывает регистр (users/backends.py)
+            "email": {"validators": [UniqueValidator(
+                queryset=User.objects.all(), lookup='iexact',
+                message=EMAIL_EXIST_ERROR)]},
         }
 
     def create(self, validated_data):
@@ -134,13 +241,14 @@ class RecipeIngredientSerializer(ModelSerializer):
         return obj.ingredient.measurement_unit
 
 
-class RecipeSerializer(ModelSerializer):
+class RecipeSerializer(ThumbnailMixin, ModelSerializer):
     """Сериализатор для модели Recipe."""
 
     ingredients = SerializerMethodField()
     author = SerializerMethodField(read_only=True)
     tags = SerializerMethodField()
     image = Base64ImageField()
+    thumbnails = SerializerMethodField()
     is_favorited = SerializerMethodField()
     is_in_shopping_cart = SerializerMethodField()
 
@@ -148,17 +256,33 @@ class RecipeSerializer(ModelSerializer):
         model = Recipe
         fields = (
             'id', 'tags', 'author', 'ingredients', 'is_favorited',
-            'is_in_shopping_cart', 'name', 'image', 'text', 'cooking_time'
+            'is_in_shopping_cart', 'name', 'image', 'thumbnails', 'text',
+            'cooking_time'
         )
+        list_serializer_class = RelationListSerializer
+
+    def get_thumbnail_size(self):
+        """В списке рецептов - миниатюра, на странице рецепта - оригинал."""
+        view = self.context.get('view')
+        if view is not None and getattr(view, 'action', None) == 'list':
+            return 'card'
+        return None
+
+    def load_relations(self, relations, recipes):
+        relations.load_recipes(recipe.id for recipe in recipes)
+        relations.load_authors(recipe.author_id for recipe in recipes)
 
     def get_ingredients(self, obj):
-        """Вычисление вложенной секции ingredients."""
-        ingredients = RecipeIngredient.objects.filter(recipe=obj)
+        """
+        Вычисление вложенной секции ingredients.
+        Использует prefetch_related из RecipesViewSet.get_queryset.
+        """
+        ingredients = obj.recipeingredient_set.all()
         return RecipeIngredientSerializer(ingredients, many=True).data
 
     def get_author(self, obj):
         """Вычисление вложенной секции author."""
-        return UserSerializerExtended(obj.author).data
+        return UserSerializerExtended(obj.author, context=self.context).data
 
     def get_tags(self, obj):
         """Вычисление вложенной секции tags."""
@@ -166,38 +290,30 @@ class RecipeSerializer(ModelSerializer):
 
     def get_is_favorited(self, obj):
         """Вычисление поля is_favorited."""
-        user = self.context.get('view').request.user
-        if user.is_anonymous:
-            return False
-        return Favorite.objects.filter(recipe=obj, user=user).exists()
+        return get_relations(self.context['request']).is_favorited(obj.id)
 
     def get_is_in_shopping_cart(self, obj):
         """Вычисление поля is_in_shopping_cart."""
-        user = self.context.get('view').request.user
-        if user.is_anonymous:
-            return False
-        return ShoppingCart.objects.filter(recipe=obj, user=user).exists()
+        return get_relations(
+            self.context['request']).is_in_shopping_cart(obj.id)
 
     def validate(self, data):
         """
         Добавляем поле ingredients и tags в validated_data.
         (это связи ManyToManyField)
+        Ингридиенты и теги загружаются одним запросом IN на модель,
+        в validated_data попадают уже загруженные объекты.
         """
         for key in ['ingredients', 'tags']:
             if key not in self.initial_data:
                 raise ValidationError(VALIDATION_ERROR)
         ingredients = self.initial_data['ingredients']
         tags = self.initial_data['tags']
-        ingredients_list = set()
         # Проверка полученных значений для поля ingredients
         # ingredients = [{"id": 1123, "amount": 10}]
         for ingredient_amount in ingredients:
             if not isinstance(ingredient_amount['id'], int):
                 raise ValidationError(INGREDIENT_ID_ERROR)
-            ingredient = get_object_or_404(
-                Ingredient, id=ingredient_amount['id'])
-            if ingredient in ingredients_list:
-                raise ValidationError(INGREDIENT_NAME_ERROR)
             try:
                 ingredient_amount['amount'] = int(ingredient_amount['amount'])
             except ValueError:
@@ -206,48 +322,53 @@ class RecipeSerializer(ModelSerializer):
                 raise ValidationError(INGREDIENT_COUNT_MIN_ERROR)
             if ingredient_amount['amount'] > settings.MAX_INGREDIENT_COUNT:
                 raise ValidationError(INGREDIENT_COUNT_MAX_ERROR)
-            ingredients_list.add(ingredient)
+        ingredient_ids = [
+            ingredient_amount['id'] for ingredient_amount in ingredients]
+        if len(ingredient_ids) > len(set(ingredient_ids)):
+            raise ValidationError(INGREDIENT_NAME_ERROR)
         # Проверка полученных значений для поля tags
         # tags = [1, 2]
         for tag in tags:
             if not isinstance(tag, int):
                 raise ValidationError(TAG_ID_ERROR)
-            tag = get_object_or_404(Tag, id=tag)
-            # if tag in tags_list:
-            if len(tags) > len(set(tags)):
-                raise ValidationError(TAG_NAME_ERROR)
+        if len(tags) > len(set(tags)):
+            raise ValidationError(TAG_NAME_ERROR)
+        found_ingredients = get_objects_or_404(Ingredient, ingredient_ids)
+        found_tags = get_objects_or_404(Tag, tags)
         # Проверки пройдены, добавляем поля в validated_data
-        data['ingredients'] = ingredients
-        data['tags'] = tags
+        data['ingredients'] = [
+            {
+                'ingredient': found_ingredients[ingredient_amount['id']],
+                'amount': ingredient_amount['amount']
+            }
+            for ingredient_amount in ingredients
+        ]
+        data['tags'] = [found_tags[tag] for tag in tags]
         return data
 
     def create_ingredients(self, ingredients, recipe):
         """
         Вспомонательная функция. Создает объект в модели RecipeIngredient.
-        ingredients = [{"id": 1123, "amount": 10}]
+        ingredients = [{"ingredient": <Ingredient>, "amount": 10}]
         """
         RecipeIngredient.objects.bulk_create(
             RecipeIngredient(
-                ingredient=Ingredient.objects.get(pk=ingredient_volume['id']),
-                count=ingredient_volume['amount'],
+                ingredient=ingredient_amount['ingredient'],
+                count=ingredient_amount['amount'],
                 recipe=recipe
             )
-            for ingredient_volume in ingredients
+            for ingredient_amount in ingredients
         )
 
     def create_tags(self, tags, recipe):
         """
         Вспомонательная функция. Создает объект в модели RecipeTag.
-        tags = [1, 2]
+        tags = [<Tag>, <Tag>]
         """
         RecipeTag.objects.bulk_create(
-            RecipeTag(
-                tag=Tag.objects.get(pk=tag),
-                recipe=recipe
-            )
-            for tag in tags
-        )
+            RecipeTag(tag=tag, recipe=recipe) for tag in tags)
 
+    @transaction.atomic
     def create(self, validated_data):
         """
         Создание нового рецепта методом POST.
@@ -263,20 +384,73 @@ class RecipeSerializer(ModelSerializer):
         self.create_tags(tags, recipe)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        """Изменение рецепта методом PATCH."""
-        instance.image = validated_data['image']
-        instance.name = validated_data['name']
-        instance.text = validated_data['text']
-        instance.cooking_time = validated_data['cooking_time']
-        ingredients = validated_data.pop('ingredients')
-        RecipeIngredient.objects.filter(recipe=instance).delete()
-        self.create_ingredients(ingredients, instance)
-        tags = validated_data.pop('tags')
-        RecipeTag.objects.filter(recipe=instance).delete()
-        self.create_tags(tags, instance)
-        instance.save()
-        return instance
+        """
+        Изменение рецепта методом PATCH.
+        Рецепт перечитывается с блокировкой строки до конца транзакции
+        (instance загружен get_object до блокировки), поэтому одновременные
+        изменения одного рецепта выполняются по очереди. Сохраняются только
+        измененные поля: счетчик избранного и отметка миниатюр, измененные
+        другими запросами, не затираются.
+        Связи не пересоздаются: добавляются новые, удаляются лишние,
+        у оставшихся ингридиентов меняется только количество.
+        """
+        # Автор нужен сигналам сохранения; блокируется только рецепт
+        recipe = Recipe.objects.select_related('author').select_for_update(
+            of=('self',)).get(pk=instance.pk)
+        # updated_at (auto_now) меняется при любом изменении, в том числе
+        # только связей: от него зависит ETag рецепта
+        update_fields = ['updated_at']
+        image = validated_data.pop('image', None)
+        if image is not None and not is_same_file(recipe.image, image):
+            recipe.image = image
+            # Сигнал image_changed сбрасывает thumbnails_ready
+            update_fields += ['image', 'thumbnails_ready']
+        for field in ('name', 'text', 'cooking_time'):
+            if field in validated_data:
+                setattr(recipe, field, validated_data[field])
+                update_fields.append(field)
+        self.update_ingredients(validated_data.pop('ingredients'), recipe)
+        self.update_tags(validated_data.pop('tags'), recipe)
+        recipe.save(update_fields=update_fields)
+        return recipe
+
+    def update_ingredients(self, ingredients, recipe):
+        """
+        Вспомонательная функция. Приводит связи RecipeIngredient
+        к списку ingredients, изменяя только отличающиеся строки.
+        """
+        amounts = {
+            ingredient_amount['ingredient'].id: ingredient_amount['amount']
+            for ingredient_amount in ingredients
+        }
+        links = RecipeIngredient.objects.filter(recipe=recipe)
+        links.exclude(ingredient__in=amounts).delete()
+        existing = {link.ingredient_id: link for link in links}
+        changed = []
+        for ingredient_id, link in existing.items():
+            if link.count != amounts[ingredient_id]:
+                link.count = amounts[ingredient_id]
+                changed.append(link)
+        RecipeIngredient.objects.bulk_update(changed, ['count'])
+        self.create_ingredients(
+            [
+                ingredient_amount for ingredient_amount in ingredients
+                if ingredient_amount['ingredient'].id not in existing
+            ],
+            recipe)
+
+    def update_tags(self, tags, recipe):
+        """
+        Вспомонательная функция. Приводит связи RecipeTag
+        к списку tags: добавляет новые и удаляет лишние.
+        """
+        links = RecipeTag.objects.filter(recipe=recipe)
+        links.exclude(tag__in=tags).delete()
+        existing = set(links.values_list('tag_id', flat=True))
+        self.create_tags(
+            [tag for tag in tags if tag.id not in existing], recipe)
 
 
 class ShoppingCartSerializer(ModelSerializer):
@@ -323,15 +497,48 @@ class RecipeFavoriteSerializer(ModelSerializer):
         read_only_fields = ('id', 'name', 'image', 'cooking_time')
 
 
-class RecipeForFollowSerializer(ModelSerializer):
+# Поля рецепта, которые нужны RecipeForFollowSerializer
+RECIPE_PREVIEW_FIELDS = (
+    'id', 'name', 'image', 'thumbnails_ready', 'cooking_time', 'author_id')
+
+
+class RecipeForFollowSerializer(ThumbnailMixin, ModelSerializer):
     """
     Сериализатор встроенной секции Recipe.
     (для сериализатора FollowSerializer)
     """
 
+    thumbnails = SerializerMethodField()
+
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'thumbnails', 'cooking_time')
+
+    def get_thumbnail_size(self):
+        return 'list'
+
+
+def get_recipes_preview(author_ids, limit):
+    """
+    Последние limit рецептов каждого автора одним запросом.
+    Номер рецепта у автора вычисляется оконной функцией ROW_NUMBER,
+    загружаются только поля, нужные RecipeForFollowSerializer.
+    """
+    if not author_ids:
+        return []
+    if limit is None:
+        return Recipe.objects.filter(author__in=author_ids).only(
+            *RECIPE_PREVIEW_FIELDS).order_by('-pub_date', '-id')
+    columns = ', '.join(RECIPE_PREVIEW_FIELDS)
+    return Recipe.objects.raw(
+        f'SELECT {columns} FROM ('
+        f'SELECT {columns}, ROW_NUMBER() OVER ('
+        f'PARTITION BY author_id ORDER BY pub_date DESC, id DESC'
+        f') AS row_number FROM {Recipe._meta.db_table} '
+        f'WHERE author_id IN ({", ".join(["%s"] * len(author_ids))})'
+        f') AS preview WHERE row_number <= %s '
+        f'ORDER BY author_id, row_number',
+        [*author_ids, limit])
 
 
 class FollowSerializer(UserSerializerExtended):
@@ -346,39 +553,50 @@ class FollowSerializer(UserSerializerExtended):
         fields = (
             'email', 'id', 'username', 'first_name', 'last_name',
             'is_subscribed', 'recipes', 'recipes_count')
-
-    def get_is_subscribed(self, obj):
+        list_serializer_class = RelationListSerializer
+
+    def load_relations(self, relations, authors):
+        """Кроме подписок загружает рецепты всех авторов страницы."""
+        super().load_relations(relations, authors)
+        recipes = {author.id: [] for author in authors}
+        for recipe in get_recipes_preview(
+            list(recipes), self.get_recipes_limit()
+        ):
+            recipes[recipe.author_id].append(recipe)
+        for author in authors:
+            author.recipes_preview = recipes[author.id]
+
+    def get_recipes_limit(self):
         """
-        Функция переопределена.
-        Вместо self.context.get('view').request
-        Используется self.context['request'].user
+        GET query parameter <recipes_limit> -
+        количество объектов во вложенной секции recipes.
         """
-        return Follow.objects.filter(
-            user=self.context['request'].user, author=obj).exists()
+        recipes_limit = self.context.get(
+            'request').query_params.get('recipes_limit')
+        if not recipes_limit:
+            return None
+        try:
+            return int(recipes_limit)
+        except ValueError:
+            raise ValidationError(LIMIT_NAME_ERROR)
 
     def get_recipes(self, obj):
         """
-        Вычисление вложенной секции recipes.
+        Вычисление вложенной секции recipes (сначала новые рецепты).
         Модель Recipe имеет поле author.
         (ForeignKey в модель User при этом ее related_name=recipes)
         """
-        # Все рецепты, автором которых является интересующий User
-        recipes = Recipe.objects.filter(author=obj)
-        # GET query parameter <recipes_limit> -
-        # количество объектов во вложенной секции recipes
-        recipes_limit = self.context.get(
-            'request').query_params.get('recipes_limit')
-        if recipes_limit:
-            try:
-                recipes_limit = int(recipes_limit)
-            except ValueError:
-                raise ValidationError(LIMIT_NAME_ERROR)
-            recipes = recipes[:recipes_limit]
+        recipes = getattr(obj, 'recipes_preview', None)
+        if recipes is None:
+            recipes = get_recipes_preview([obj.id], self.get_recipes_limit())
         return RecipeForFollowSerializer(recipes, many=True).data
 
     def get_recipes_count(self, obj):
-        """Вычисление поля recipes_count."""
-        return Recipe.objects.filter(author=obj).count()
+        """
+        Вычисление поля recipes_count.
+        Счетчик хранится в модели User (recipes/signals.py).
+        """
+        return obj.recipes_count
 
 
 class FollowSerializerSuscribe(ModelSerializer):
@@ -396,3 +614,24 @@ class FollowSerializerSuscribe(ModelSerializer):
         ).exists():
             raise ValidationError(FOLLOW_EXIST_ERROR)
         return value
+
+
+class JobSerializer(ModelSerializer):
+    """Сериализатор статуса фоновой задачи."""
+
+    result = SerializerMethodField()
+    error = SerializerMethodField()
+
+    class Meta:
+        model = Job
+        fields = (
+            'id', 'name', 'status', 'attempts', 'result', 'error',
+            'created_at', 'finished_at')
+
+    def get_result(self, obj):
+        """Результат задачи (JSON), пока задача не выполнена - null."""
+        return json.loads(obj.result) if obj.result else None
+
+    def get_error(self, obj):
+        """Последняя строка traceback, без подробностей выполнения."""
+        return obj.error.strip().splitlines()[-1] if obj.error else None
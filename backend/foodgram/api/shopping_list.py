@@ -0,0 +1,181 @@
+"""
+Формирование файла со списком покупок.
+Поддерживаются форматы pdf, csv и txt, готовые файлы кешируются на диске
+(не больше SHOPPING_LIST_CACHE_MAX_FILES, время изменения файла - время
+последнего скачивания).
+"""
+import csv
+import hashlib
+import io
+import os
+import tempfile
+
+from django.conf import settings
+
+TITLE = 'Cписок покупок:'
+LINE = '{name} ---> {amount} ({unit})'
+# Размер блока при отдаче файла
+CHUNK_SIZE = 64 * 1024
+
+
+class TextRenderer:
+    """Список покупок в виде простого текста."""
+
+    extension = 'txt'
+    content_type = 'text/plain; charset=utf-8'
+
+    def render(self, ingredients):
+        yield f'{TITLE}\n'.encode()
+        for name, unit, amount in ingredients:
+            line = LINE.format(name=name, amount=amount, unit=unit)
+            yield f' {line}\n'.encode()
+
+
+class CsvRenderer:
+    """Список покупок в формате csv (открывается в Excel)."""
+
+    extension = 'csv'
+    content_type = 'text/csv; charset=utf-8'
+    header = ('Ингридиент', 'Количество', 'Единица измерения')
+
+    def render(self, ingredients):
+        # BOM нужен Excel, чтобы определить кодировку utf-8
+        yield '\ufeff'.encode()
+        yield self.row(self.header)
+        for name, unit, amount in ingredients:
+            yield self.row((name, amount, unit))
+
+    def row(self, values):
+        buffer = io.StringIO()
+        csv.writer(buffer).writerow(values)
+        return buffer.getvalue().encode()
+
+
+class PdfRenderer:
+    """
+    Список покупок в формате pdf.
+    Для кириллицы используется TrueType шрифт SHOPPING_LIST_FONT.
+    """
+
+    extension = 'pdf'
+    content_type = 'application/pdf'
+    font_name = 'ShoppingListFont'
+    title_size = 16
+    font_size = 12
+    margin = 50
+
+    def render(self, ingredients):
+        # Импорт здесь: reportlab нужен только для pdf
+        from reportlab.lib.pagesizes import A4
+        from reportlab.pdfbase import pdfmetrics
+        from reportlab.pdfbase.ttfonts import TTFont
+        from reportlab.pdfgen.canvas import Canvas
+
+        if self.font_name not in pdfmetrics.getRegisteredFontNames():
+            pdfmetrics.registerFont(
+                TTFont(self.font_name, settings.SHOPPING_LIST_FONT))
+        # Таблица ссылок pdf пишется в конце документа,
+        # поэтому файл целиком собирается до отдачи первого блока
+        buffer = io.BytesIO()
+        canvas = Canvas(buffer, pagesize=A4)
+        width, height = A4
+        canvas.setFont(self.font_name, self.title_size)
+        canvas.drawString(self.margin, height - self.margin, TITLE)
+        line_height = self.font_size * 1.5
+        y = height - self.margin - self.title_size * 2
+        canvas.setFont(self.font_name, self.font_size)
+        for name, unit, amount in ingredients:
+            if y < self.margin:
+                canvas.showPage()
+                canvas.setFont(self.font_name, self.font_size)
+                y = height - self.margin
+            canvas.drawString(
+                self.margin, y,
+                LINE.format(name=name, amount=amount, unit=unit))
+            y -= line_height
+        canvas.save()
+        buffer.seek(0)
+        yield from iter(lambda: buffer.read(CHUNK_SIZE), b'')
+
+
+RENDERERS = {
+    renderer.extension: renderer
+    for renderer in (PdfRenderer(), CsvRenderer(), TextRenderer())
+}
+
+
+def get_cache_path(renderer, ingredients):
+    """
+    Путь к файлу в кеше.
+    Ключ - хеш содержимого корзины, поэтому файл для неизменной корзины
+    не формируется повторно (и общий для одинаковых корзин).
+    """
+    key = hashlib.sha256(
+        repr((renderer.extension, ingredients)).encode()).hexdigest()
+    return os.path.join(
+        settings.SHOPPING_LIST_CACHE_DIR, f'{key}.{renderer.extension}')
+
+
+def open_cached(path):
+    """
+    Открыть файл из кеша или None, если его нет (в том числе если его
+    только что удалил prune_cache другого процесса). Файл отмечается
+    как использованный.
+    """
+    try:
+        file = open(path, 'rb')
+    except FileNotFoundError:
+        return None
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+    return file
+
+
+def prune_cache(directory):
+    """
+    Оставить в кеше SHOPPING_LIST_CACHE_MAX_FILES файлов, которые
+    скачивали последними. Временные файлы незавершенной записи
+    не учитываются.
+    """
+    extensions = tuple(f'.{extension}' for extension in RENDERERS)
+    files = []
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if not entry.name.endswith(extensions):
+                continue
+            try:
+                files.append((entry.stat().st_mtime, entry.path))
+            except FileNotFoundError:
+                continue
+    if len(files) <= settings.SHOPPING_LIST_CACHE_MAX_FILES:
+        return
+    files.sort()
+    for mtime, path in files[:-settings.SHOPPING_LIST_CACHE_MAX_FILES]:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            # Файл уже удалил другой процесс
+            pass
+
+
+def render_to_cache(renderer, ingredients, path):
+    """
+    Отдает файл по частям, одновременно сохраняя его в кеш.
+    Файл появляется в кеше только после успешного завершения записи.
+    """
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    file = tempfile.NamedTemporaryFile(dir=directory, delete=False)
+    temp_path = file.name
+    try:
+        with file:
+            for chunk in renderer.render(ingredients):
+                file.write(chunk)
+                yield chunk
+        os.replace(temp_path, path)
+        prune_cache(directory)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
@@ -0,0 +1,104 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from api import authentication, ingredient_index, recipe_cache
+from api.versions import TAGS_VERSION, bump_version
+from recipes.models import Favorite, Ingredient, Recipe, Tag
+from users.models import User
+
+# Поля пользователя, которые выводятся в рецептах как данные автора
+AUTHOR_FIELDS = ('username', 'email', 'first_name', 'last_name')
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def ingredient_changed(**kwargs):
+    """
+    Изменение ингридиента (админка): перестроить индекс поиска
+    и сбросить кеш ответов справочника. Сброс после фиксации транзакции:
+    иначе другой процесс может перестроить индекс по прежним данным
+    и хранить его с новой версией до INGREDIENT_INDEX_TTL.
+    """
+    transaction.on_commit(ingredient_index.invalidate)
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def tag_changed(**kwargs):
+    """
+    Изменение тега: сбросить кеш ответов справочника после фиксации
+    транзакции (как recipe_changed). Иначе другой процесс может
+    закешировать прежний список под новой версией, и клиенты будут
+    получать 304 на устаревшие данные.
+    """
+    transaction.on_commit(lambda: bump_version(TAGS_VERSION))
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def recipe_changed(instance, **kwargs):
+    """
+    Рецепт создан, изменен или удален: сбросить кеш страниц списка.
+    Сброс после фиксации транзакции, когда связи рецепта уже сохранены.
+    Если автор не загружен (каскадное удаление рецептов вместе с автором,
+    удаление списком в админке), username не запрашивается для каждого
+    рецепта: сбрасываются страницы всех авторов.
+    """
+    if not Recipe.author.is_cached(instance):
+        transaction.on_commit(recipe_cache.invalidate_all_authors)
+        return
+    username = instance.author.username
+    transaction.on_commit(lambda: recipe_cache.invalidate(username))
+
+
+@receiver((post_save, post_delete), sender=Favorite)
+def favorite_changed(**kwargs):
+    """Изменился счетчик избранного: сбросить страницы ordering=popular."""
+    transaction.on_commit(recipe_cache.invalidate_favorites)
+
+
+@receiver(pre_save, sender=User)
+def remember_author_fields(instance, update_fields=None, **kwargs):
+    """
+    Запомнить прежние данные автора для сравнения в author_changed.
+    Новые пользователи и сохранения без полей автора (last_login,
+    пароль, счетчики) - без запроса.
+    """
+    if instance._state.adding or (
+        update_fields is not None
+        and not set(update_fields) & set(AUTHOR_FIELDS)
+    ):
+        return
+    instance.previous_author_fields = User.objects.filter(
+        pk=instance.pk).values(*AUTHOR_FIELDS).first()
+
+
+@receiver(post_save, sender=User)
+def author_changed(instance, **kwargs):
+    """Данные автора изменились (например, username): сбросить кеш."""
+    previous = getattr(instance, 'previous_author_fields', None)
+    if not previous or all(
+        previous[field] == getattr(instance, field)
+        for field in AUTHOR_FIELDS
+    ):
+        return
+    usernames = (previous['username'], instance.username)
+    transaction.on_commit(lambda: recipe_cache.invalidate(*usernames))
+
+
+@receiver(post_save, sender=User)
+def user_changed(instance, created, **kwargs):
+    """
+    Пользователь сохранен (смена пароля, деактивация, права):
+    сбросить кеш его токенов.
+    """
+    if created:
+        return
+    user_id = instance.pk
+    transaction.on_commit(lambda: authentication.invalidate(user_id))
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(instance, **kwargs):
+    """Токен удален (выход, удаление пользователя): сбросить кеш."""
+    user_id = instance.user_id
+    transaction.on_commit(lambda: authentication.invalidate(user_id))
@@ -0,0 +1,969 @@
+import base64
+import io
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api import timing
+from api.authentication import token_cache
+from api.constants import (EMAIL_EXIST_ERROR, ERROR_MESSAGE_FOR_USERNAME,
+                           IMAGE_FORMAT_ERROR, IMAGE_SIZE_ERROR)
+from api.filters import POPULAR, IngredientFilter
+from api.ingredient_index import IngredientIndex, ingredient_index
+from api.recipe_cache import recipe_list_cache
+from api.serializers import RecipeSerializer
+from api.timing import query_budget
+from api.versions import INGREDIENTS_VERSION, get_version
+from api.views import IngredientsViewSet, TagsViewSet
+from jobs.models import Job
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            RecipeTag, ShoppingCart, Tag)
+from users.models import Follow, User
+
+# Запросов к базе на странице рецепта: варианты фильтра tags, рецепт
+# с автором, ингридиенты, теги и флаги текущего пользователя (избранное,
+# список покупок, подписка)
+RECIPE_DETAIL_QUERIES = 7
+# Для списка любого размера добавляется COUNT пагинации
+RECIPE_LIST_QUERIES = RECIPE_DETAIL_QUERIES + 1
+# Создание рецепта вместе с сигналами счетчиков и кешей; от числа
+# ингридиентов и тегов не зависит
+RECIPE_CREATE_QUERIES = 13
+# Регистрация: проверки уникальности email и username, INSERT
+USER_CREATE_QUERIES = 3
+# Подписки: COUNT пагинации, авторы, флаги is_subscribed и рецепты
+# всех авторов страницы
+SUBSCRIPTIONS_QUERIES = 4
+# Строка EXPLAIN QUERY PLAN (SQLite) для просмотра таблицы без индекса
+SQLITE_SCAN = re.compile(r'^SCAN (?:TABLE )?(\w+)(?: AS \w+)?$')
+
+
+class ApiTestMixin:
+    """
+    Кеши api (версии, список покупок, снимок индекса ингридиентов)
+    и загруженные картинки пишутся во временный каталог, кеши процесса
+    очищаются перед тестом, миниатюры ставятся в очередь jobs.
+    """
+
+    def setUp(self):
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir, ignore_errors=True)
+        settings_override = override_settings(
+            CACHE_DIR=cache_dir,
+            SHOPPING_LIST_CACHE_DIR=os.path.join(cache_dir, 'shopping_list'),
+            INGREDIENT_INDEX_SNAPSHOT=os.path.join(
+                cache_dir, 'ingredient_index.json'),
+            MEDIA_ROOT=os.path.join(cache_dir, 'media'),
+            # Миниатюры не строятся в пуле потоков после фиксации
+            # транзакции: задача остается в очереди jobs
+            THUMBNAIL_QUEUE='jobs')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        for cache in (
+            recipe_list_cache, token_cache,
+            TagsViewSet.catalog_cache, IngredientsViewSet.catalog_cache,
+        ):
+            cache.clear()
+        ingredient_index.version = None
+        self.client = APIClient()
+
+    def create_user(self, username, **kwargs):
+        return User.objects.create_user(
+            username=username, email=f'{username}@localhost',
+            password=f'{username}_password', **kwargs)
+
+    def create_recipes(self, author, count, ingredients=3, tags=2):
+        """count рецептов автора, у каждого ingredients ингридиентов."""
+        tag_objects = [
+            Tag.objects.get_or_create(slug=f'tag_{number}', defaults={
+                'name': f'Тег {number}', 'color': f'#{number:06}'})[0]
+            for number in range(tags)
+        ]
+        ingredient_objects = [
+            Ingredient.objects.get_or_create(
+                name=f'Ингридиент {number}', measurement_unit='г')[0]
+            for number in range(ingredients)
+        ]
+        recipes = []
+        for number in range(count):
+            recipe = Recipe.objects.create(
+                author=author, name=f'Рецепт {number}', text='Описание',
+                cooking_time=10, image='recipes/image/test.png')
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(recipe=recipe, ingredient=ingredient, count=1)
+                for ingredient in ingredient_objects)
+            RecipeTag.objects.bulk_create(
+                RecipeTag(recipe=recipe, tag=tag) for tag in tag_objects)
+            recipes.append(recipe)
+        return recipes
+
+
+class ApiTestCase(ApiTestMixin, TestCase):
+    pass
+
+
+class RecipeListQueriesTest(ApiTestCase):
+    """Число запросов списка рецептов не зависит от размера страницы."""
+
+    def setUp(self):
+        super().setUp()
+        self.user = self.create_user('reader')
+        author = self.create_user('author')
+        recipes = self.create_recipes(author, 20)
+        Favorite.objects.create(user=self.user, recipe=recipes[0])
+        ShoppingCart.objects.create(user=self.user, recipe=recipes[1])
+        Follow.objects.create(user=self.user, author=author)
+        self.client.force_authenticate(self.user)
+
+    def test_list_queries_do_not_depend_on_page_size(self):
+        for limit in (1, 6, 20):
+            with self.subTest(limit=limit):
+                with query_budget(RECIPE_LIST_QUERIES):
+                    response = self.client.get(f'/api/recipes/?limit={limit}')
+                self.assertEqual(len(response.data['results']), limit)
+
+    def test_detail_queries(self):
+        recipe = Recipe.objects.first()
+        with query_budget(RECIPE_DETAIL_QUERIES):
+            response = self.client.get(f'/api/recipes/{recipe.pk}/')
+        self.assertEqual(len(response.data['ingredients']), 3)
+
+
+@override_settings(REQUEST_TIMING=True)
+class RequestTimingTest(ApiTestCase):
+    """Замеры запроса: заголовок Server-Timing и строка в логе."""
+
+    def setUp(self):
+        super().setUp()
+        timing.install()
+        self.addCleanup(timing.uninstall)
+        author = self.create_user('author')
+        self.create_recipes(author, 6)
+        self.client.force_authenticate(author)
+
+    def test_timings(self):
+        with self.assertLogs('api.timing') as logs:
+            response = self.client.get('/api/recipes/')
+        self.assertIn('serializer;dur=', response['Server-Timing'])
+        self.assertIn(
+            f'desc="SQL ({RECIPE_LIST_QUERIES})"', response['Server-Timing'])
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['view'], 'RecipesViewSet.list')
+        self.assertEqual(record['queries'], RECIPE_LIST_QUERIES)
+        self.assertGreater(record['serializer_ms'], 0)
+
+
+class RecipeCursorTest(ApiTestCase):
+    """
+    Курсорная пагинация проходит все рецепты без повторов и пропусков,
+    в том числе когда у рецептов одинаковые pub_date и favorites_count.
+    """
+
+    def setUp(self):
+        super().setUp()
+        recipes = self.create_recipes(self.create_user('author'), 12)
+        self.ids = [recipe.pk for recipe in recipes]
+        Recipe.objects.update(pub_date=recipes[0].pub_date)
+        for recipe in recipes:
+            Recipe.objects.filter(pk=recipe.pk).update(
+                favorites_count=recipe.pk % 3)
+
+    def walk(self, **params):
+        """id рецептов всех страниц по ссылкам next."""
+        response = self.client.get(
+            '/api/recipes/', {'cursor': '', 'limit': 5, **params})
+        ids = []
+        while True:
+            self.assertEqual(response.status_code, 200)
+            ids.extend(recipe['id'] for recipe in response.data['results'])
+            if response.data['next'] is None:
+                return ids
+            response = self.client.get(response.data['next'])
+
+    def test_default_ordering(self):
+        self.assertEqual(self.walk(), self.ids)
+
+    def test_popular_ordering(self):
+        # favorites_count по убыванию, при равенстве - сначала новые
+        self.assertEqual(
+            self.walk(ordering=POPULAR),
+            sorted(self.ids, key=lambda pk: (-(pk % 3), -pk)))
+
+
+def get_image_data():
+    """Картинка PNG 1x1 в base64, как ее отправляет фронтенд."""
+    buffer = io.BytesIO()
+    Image.new('RGB', (1, 1)).save(buffer, 'PNG')
+    return (
+        'data:image/png;base64,'
+        + base64.b64encode(buffer.getvalue()).decode())
+
+
+class RecipeWriteQueriesTest(ApiTestCase):
+    """
+    Создание рецепта: ингридиенты и теги проверяются запросом IN
+    и записываются bulk_create, поэтому число запросов не зависит
+    от их количества.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.author = self.create_user('author')
+        self.ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингридиент {number}', measurement_unit='г')
+            for number in range(20)
+        ]
+        self.tags = [
+            Tag.objects.create(
+                name=f'Тег {number}', color=f'#{number:06}',
+                slug=f'tag_{number}')
+            for number in range(5)
+        ]
+        self.client.force_authenticate(self.author)
+
+    def create_recipe(self, ingredients, tags):
+        with query_budget(RECIPE_CREATE_QUERIES) as context:
+            response = self.client.post('/api/recipes/', {
+                'ingredients': [
+                    {'id': ingredient.pk, 'amount': 10}
+                    for ingredient in ingredients],
+                'tags': [tag.pk for tag in tags],
+                'image': get_image_data(),
+                'name': 'Рецепт',
+                'text': 'Описание',
+                'cooking_time': 10,
+            }, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(len(response.data['ingredients']), len(ingredients))
+        return len(context)
+
+    def test_create_queries_do_not_depend_on_links_count(self):
+        self.assertEqual(
+            self.create_recipe(self.ingredients[:1], self.tags[:1]),
+            self.create_recipe(self.ingredients, self.tags))
+
+    def test_missing_ingredients_are_listed(self):
+        response = self.client.post('/api/recipes/', {
+            'ingredients': [{'id': 0, 'amount': 1}, {'id': -1, 'amount': 1}],
+            'tags': [self.tags[0].pk],
+            'image': get_image_data(),
+            'name': 'Рецепт',
+            'text': 'Описание',
+            'cooking_time': 10,
+        }, format='json')
+        self.assertEqual(response.status_code, 404)
+        self.assertIn('[-1, 0]', str(response.data))
+
+
+class RecipeUpdateTest(ApiTestCase):
+    """
+    Изменение рецепта не затирает поля, измененные другими запросами
+    после загрузки объекта представлением.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.author = self.create_user('author')
+        self.recipe, = self.create_recipes(self.author, 1)
+
+    def test_concurrent_changes_are_kept(self):
+        stale_recipe = Recipe.objects.get(pk=self.recipe.pk)
+        Favorite.objects.create(
+            user=self.create_user('reader'), recipe=self.recipe)
+        Recipe.objects.filter(pk=self.recipe.pk).update(thumbnails_ready=True)
+        links = RecipeIngredient.objects.filter(recipe=self.recipe)
+        serializer = RecipeSerializer(stale_recipe, data={
+            'ingredients': [
+                {'id': link.ingredient_id, 'amount': 5} for link in links],
+            'tags': list(self.recipe.tags.values_list('pk', flat=True)),
+            'name': 'Новое название',
+        }, partial=True)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.name, 'Новое название')
+        self.assertEqual(self.recipe.favorites_count, 1)
+        self.assertTrue(self.recipe.thumbnails_ready)
+
+
+class JobsTest(ApiTestMixin, TransactionTestCase):
+    """Фоновые задачи видны пользователю, для которого поставлены."""
+
+    def setUp(self):
+        super().setUp()
+        self.author = self.create_user('author')
+
+    def test_thumbnail_job_belongs_to_author(self):
+        self.client.force_authenticate(self.author)
+        response = self.client.post('/api/recipes/', {
+            'ingredients': [],
+            'tags': [],
+            'image': get_image_data(),
+            'name': 'Рецепт',
+            'text': 'Описание',
+            'cooking_time': 10,
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        response = self.client.get('/api/jobs/')
+        self.assertEqual(
+            [job['name'] for job in response.data['results']],
+            ['build_thumbnails'])
+        self.client.force_authenticate(self.create_user('reader'))
+        response = self.client.get('/api/jobs/')
+        self.assertEqual(response.data['results'], [])
+
+    def test_recount_counters_is_enqueued_by_admin(self):
+        self.client.force_authenticate(self.author)
+        response = self.client.post('/api/jobs/recount_counters/')
+        self.assertEqual(response.status_code, 403)
+        admin = self.create_user('admin', is_staff=True)
+        self.client.force_authenticate(admin)
+        response = self.client.post('/api/jobs/recount_counters/')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(
+            list(Job.objects.values_list('name', 'user')),
+            [('recount_counters', admin.pk)])
+
+
+class SubscriptionsTest(ApiTestCase):
+    """
+    Подписки: последние recipes_limit рецептов каждого автора загружаются
+    одним запросом для всей страницы.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.user = self.create_user('reader')
+        self.client.force_authenticate(self.user)
+        self.recipes = {}
+        for username, count in (('first', 3), ('second', 2)):
+            self.follow(username, count)
+
+    def follow(self, username, count):
+        author = self.create_user(username)
+        Follow.objects.create(user=self.user, author=author)
+        # Сначала новые рецепты
+        self.recipes[username] = [
+            recipe.pk for recipe in reversed(
+                self.create_recipes(author, count))]
+
+    def get_recipes(self, **params):
+        with query_budget(SUBSCRIPTIONS_QUERIES):
+            response = self.client.get('/api/users/subscriptions/', params)
+        self.assertEqual(response.status_code, 200, response.data)
+        return {
+            author['username']: [recipe['id'] for recipe in author['recipes']]
+            for author in response.data['results']}
+
+    def test_recipes_limit(self):
+        self.assertEqual(self.get_recipes(recipes_limit=1), {
+            username: recipes[:1]
+            for username, recipes in self.recipes.items()})
+        self.assertEqual(self.get_recipes(recipes_limit=10), self.recipes)
+        self.assertEqual(self.get_recipes(), self.recipes)
+
+    def test_recipes_limit_is_integer(self):
+        response = self.client.get(
+            '/api/users/subscriptions/', {'recipes_limit': 'abc'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_queries_do_not_depend_on_authors_count(self):
+        for number in range(5):
+            self.follow(f'author_{number}', 2)
+        self.assertEqual(len(self.get_recipes(recipes_limit=1)), 7)
+
+
+class UserCreateTest(ApiTestCase):
+    """Регистрация: ответ строится по созданному объекту, без перечитывания."""
+
+    def test_create(self):
+        with query_budget(USER_CREATE_QUERIES) as context:
+            response = self.client.post('/api/users/', {
+                'email': 'new@localhost', 'username': 'new',
+                'first_name': 'Имя', 'last_name': 'Фамилия',
+                'password': 'new_user_password'}, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertNotIn('password', response.data)
+        self.assertEqual(response.data['username'], 'new')
+        selects = [
+            query['sql'] for query in context.captured_queries
+            if query['sql'].startswith('SELECT')
+            and 'WHERE "users_user"."id" =' in query['sql']]
+        self.assertEqual(selects, [])
+
+    def test_email_is_unique_ignoring_case(self):
+        self.create_user('user')
+        response = self.client.post('/api/users/', {
+            'email': 'USER@localhost', 'username': 'new',
+            'first_name': 'Имя', 'last_name': 'Фамилия',
+            'password': 'new_user_password'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['email'], [EMAIL_EXIST_ERROR])
+        self.assertFalse(User.objects.filter(username='new').exists())
+
+
+class LoginTest(ApiTestCase):
+    """Вход по email без учета регистра; username не принимается."""
+
+    def setUp(self):
+        super().setUp()
+        self.user = self.create_user('user')
+
+    def login(self, **data):
+        return self.client.post(
+            '/api/auth/token/login/', data, format='json')
+
+    def assertUnauthorized(self, response):
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(
+            response.data, {'field_errors': [ERROR_MESSAGE_FOR_USERNAME]})
+
+    def test_login(self):
+        response = self.login(
+            email='USER@localhost', password='user_password')
+        self.assertEqual(response.status_code, 200, response.data)
+        token = Token.objects.get(user=self.user)
+        self.assertEqual(response.data, {'auth_token': token.key})
+        # Повторный вход возвращает тот же токен
+        response = self.login(
+            email='user@localhost', password='user_password')
+        self.assertEqual(response.data, {'auth_token': token.key})
+
+    def test_wrong_password(self):
+        self.assertUnauthorized(
+            self.login(email='user@localhost', password='wrong'))
+
+    def test_unknown_email(self):
+        self.assertUnauthorized(
+            self.login(email='unknown@localhost', password='user_password'))
+
+    def test_username(self):
+        self.assertUnauthorized(
+            self.login(username='user', password='user_password'))
+        self.assertUnauthorized(self.login(
+            username='user', email='user@localhost',
+            password='user_password'))
+        self.assertFalse(Token.objects.exists())
+
+    def test_email_differs_only_in_case(self):
+        # Адреса, заведенные до проверки регистра при регистрации
+        other = User.objects.create_user(
+            username='other', email='USER@localhost',
+            password='other_password')
+        response = self.login(
+            email='user@localhost', password='other_password')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(
+            response.data['auth_token'], Token.objects.get(user=other).key)
+        self.assertUnauthorized(
+            self.login(email='user@localhost', password='wrong'))
+
+
+class RecipeImageTest(ApiTestCase):
+    """Картинка рецепта в base64 и ссылки на миниатюры в ответах."""
+
+    def setUp(self):
+        super().setUp()
+        self.author = self.create_user('author')
+        self.client.force_authenticate(self.author)
+
+    def create_recipe(self, image):
+        return self.client.post('/api/recipes/', {
+            'ingredients': [],
+            'tags': [],
+            'image': image,
+            'name': 'Рецепт',
+            'text': 'Описание',
+            'cooking_time': 10,
+        }, format='json')
+
+    def test_size_is_checked_before_decoding(self):
+        # Строка не декодируется: ошибка размера, а не формата
+        with override_settings(MAX_IMAGE_SIZE=10):
+            response = self.create_recipe(
+                'data:image/png;base64,' + '@' * 100)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['image'], IMAGE_SIZE_ERROR)
+
+    def test_invalid_base64(self):
+        response = self.create_recipe('data:image/png;base64,@@@@')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.data['image'], IMAGE_FORMAT_ERROR)
+
+    def test_not_an_image(self):
+        response = self.create_recipe(
+            'data:image/png;base64,'
+            + base64.b64encode(b'not an image').decode())
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('image', response.data)
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_thumbnail_urls(self):
+        response = self.create_recipe(get_image_data())
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertIsNone(response.data['thumbnails'])
+        recipe = Recipe.objects.get()
+        Recipe.objects.update(thumbnails_ready=True)
+        stem = os.path.basename(recipe.image.name).replace('.', '_')
+        reader = self.create_user('reader')
+        Follow.objects.create(user=reader, author=self.author)
+        self.client.force_authenticate(reader)
+        # Список рецептов - размер card, подписки - list
+        card, = self.client.get('/api/recipes/').data['results']
+        preview, = self.client.get(
+            '/api/users/subscriptions/').data['results'][0]['recipes']
+        for data, size in ((card, 'card'), (preview, 'list')):
+            with self.subTest(size):
+                for extension, url in data['thumbnails'][size].items():
+                    self.assertTrue(url.endswith(
+                        f'/media/recipes/thumbnails/{stem}_{size}'
+                        f'.{extension}'), url)
+                self.assertEqual(
+                    data['image'], data['thumbnails'][size]['jpeg'])
+        self.assertTrue(card['image'].startswith('http://testserver/'))
+
+
+class SetPasswordTest(ApiTestCase):
+    """
+    Смена пароля пользователем из кеша токенов: сохраняется только
+    пароль, следующий запрос видит новый пароль.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.user = self.create_user('user')
+        token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+    def set_password(self, current_password, new_password):
+        return self.client.post('/api/users/set_password/', {
+            'current_password': current_password,
+            'new_password': new_password}, format='json')
+
+    def test_password_is_changed_twice(self):
+        # Пользователь попадает в кеш токенов до изменения счетчика
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 200)
+        self.create_recipes(self.user, 2)
+        response = self.set_password('user_password', 'first_new_password')
+        self.assertEqual(response.status_code, 204, response.data)
+        response = self.set_password(
+            'first_new_password', 'second_new_password')
+        self.assertEqual(response.status_code, 204, response.data)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password('second_new_password'))
+        self.assertEqual(self.user.recipes_count, 2)
+
+
+@override_settings(SHOPPING_LIST_CACHE_MAX_FILES=2)
+class ShoppingListCacheTest(ApiTestCase):
+    """Кеш файлов списка покупок ограничен по числу файлов."""
+
+    def setUp(self):
+        super().setUp()
+        self.user = self.create_user('shopper')
+        self.recipes = self.create_recipes(self.user, 3)
+        self.client.force_authenticate(self.user)
+
+    def download(self, *recipes):
+        """Скачать список покупок с рецептами recipes, вернуть новый файл."""
+        ShoppingCart.objects.filter(user=self.user).delete()
+        for recipe in recipes:
+            ShoppingCart.objects.create(user=self.user, recipe=recipe)
+        files = self.get_cached_files()
+        # Время последнего скачивания различается
+        time.sleep(0.01)
+        response = self.client.get(
+            '/api/recipes/download_shopping_cart/?type=txt')
+        self.assertEqual(response.status_code, 200)
+        b''.join(response.streaming_content)
+        new_files = self.get_cached_files() - files
+        return new_files.pop() if new_files else None
+
+    def get_cached_files(self):
+        if not os.path.isdir(settings.SHOPPING_LIST_CACHE_DIR):
+            return set()
+        return set(os.listdir(settings.SHOPPING_LIST_CACHE_DIR))
+
+    def test_least_recently_downloaded_file_is_pruned(self):
+        first, second, third = self.recipes
+        first_file = self.download(first)
+        second_file = self.download(first, second)
+        # Первый список скачан снова - из кеша
+        self.assertIsNone(self.download(first))
+        third_file = self.download(first, second, third)
+        self.assertEqual(
+            self.get_cached_files(), {first_file, third_file})
+        self.assertNotEqual(second_file, third_file)
+
+
+class IngredientIndexTest(ApiTestMixin, TransactionTestCase):
+    """Индекс ингридиентов не перестраивается по незафиксированным данным."""
+
+    def search(self):
+        return [
+            ingredient.name for ingredient in ingredient_index.search('со')]
+
+    def test_invalidated_after_commit(self):
+        Ingredient.objects.create(name='соль', measurement_unit='г')
+        self.assertEqual(self.search(), ['соль'])
+        version = get_version(INGREDIENTS_VERSION)
+        with transaction.atomic():
+            Ingredient.objects.create(name='сода', measurement_unit='г')
+            # До фиксации индекс других процессов не сбрасывается
+            self.assertEqual(get_version(INGREDIENTS_VERSION), version)
+        self.assertNotEqual(get_version(INGREDIENTS_VERSION), version)
+        self.assertEqual(self.search(), ['сода', 'соль'])
+
+    def create_ingredients(self):
+        for name, unit in (
+            ('морская соль', 'г'), ('б соль', 'г'), ('соль', 'г'),
+            ('а соль', 'кг'), ('солянка', 'г'), ('а соль', 'г'),
+            ('перец', 'г'),
+        ):
+            Ingredient.objects.create(name=name, measurement_unit=unit)
+
+    def test_infix_matches_follow_prefix_matches(self):
+        self.create_ingredients()
+        response = self.client.get(
+            '/api/ingredients/', {'name': 'сол', 'mode': 'infix'})
+        # Одинаковые названия - в порядке id
+        self.assertEqual(
+            [(item['name'], item['measurement_unit'])
+             for item in response.data],
+            [('соль', 'г'), ('солянка', 'г'), ('а соль', 'кг'),
+             ('а соль', 'г'), ('б соль', 'г'), ('морская соль', 'г')])
+        response = self.client.get(
+            '/api/ingredients/', {'name': 'сол', 'mode': 'prefix'})
+        self.assertEqual(
+            [item['name'] for item in response.data], ['соль', 'солянка'])
+
+    def test_infix_search_is_the_same_in_database(self):
+        # Ветка PostgreSQL (запрос к базе) и индекс в памяти (SQLite)
+        # возвращают ингридиенты в одном порядке
+        self.create_ingredients()
+        self.assertEqual(
+            IngredientFilter().query_infix(Ingredient.objects.all(), 'сол'),
+            ingredient_index.search_infix('сол'))
+
+    def test_snapshot_age_is_kept(self):
+        Ingredient.objects.create(name='соль', measurement_unit='г')
+        ingredient_index.search('со')
+        # Другой процесс загружает снимок: срок жизни индекса
+        # отсчитывается от чтения базы, а не от загрузки снимка
+        index = IngredientIndex()
+        with override_settings(INGREDIENT_INDEX_TTL=0.2):
+            index.search('со')
+            self.assertEqual(index.loaded_at, ingredient_index.loaded_at)
+            time.sleep(0.2)
+            version = get_version(INGREDIENTS_VERSION)
+            self.assertFalse(index.is_fresh(version))
+
+
+class ConditionalRequestsTest(ApiTestMixin, TransactionTestCase):
+    """
+    ETag рецептов и справочников: меняется вместе с данными ответа,
+    неизмененный ответ на If-None-Match - 304 без тела.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.user = self.create_user('reader')
+        self.recipe, = self.create_recipes(self.create_user('author'), 1)
+        self.recipe_urls = (
+            '/api/recipes/', f'/api/recipes/{self.recipe.pk}/')
+        self.client.force_authenticate(self.user)
+
+    def get_etags(self, *urls):
+        etags = []
+        for url in urls:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            etags.append(response['ETag'])
+        return etags
+
+    def assertNotModified(self, urls, etags):
+        for url, etag in zip(urls, etags):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304, url)
+            self.assertEqual(response.content, b'')
+
+    def assertChanged(self, urls, etags):
+        for url, etag in zip(urls, etags):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200, url)
+            self.assertNotEqual(response['ETag'], etag)
+
+    def test_unchanged_response_is_not_modified(self):
+        urls = (*self.recipe_urls, '/api/tags/', '/api/ingredients/')
+        self.assertNotModified(urls, self.get_etags(*urls))
+
+    def test_etag_changes_after_recipe_edit(self):
+        etags = self.get_etags(*self.recipe_urls)
+        self.recipe.name = 'Новое название'
+        self.recipe.save()
+        self.assertChanged(self.recipe_urls, etags)
+
+    def test_etag_changes_after_favorite(self):
+        etags = self.get_etags(*self.recipe_urls)
+        response = self.client.post(
+            f'/api/recipes/{self.recipe.pk}/favorite/')
+        self.assertEqual(response.status_code, 201)
+        self.assertChanged(self.recipe_urls, etags)
+
+    def test_etag_changes_after_tag_change(self):
+        urls = (*self.recipe_urls, '/api/tags/')
+        etags = self.get_etags(*urls)
+        tag = Tag.objects.first()
+        tag.name = 'Новый тег'
+        tag.save()
+        self.assertChanged(urls, etags)
+
+    def test_etag_changes_after_ingredient_change(self):
+        urls = (*self.recipe_urls, '/api/ingredients/')
+        etags = self.get_etags(*urls)
+        ingredient = Ingredient.objects.first()
+        ingredient.measurement_unit = 'кг'
+        ingredient.save()
+        self.assertChanged(urls, etags)
+
+
+class RecipeListCacheTest(ApiTestMixin, TransactionTestCase):
+    """
+    Кеш страниц для анонимных пользователей сбрасывается после изменения
+    рецептов или данных автора.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.author = self.create_user('author')
+        self.recipe, = self.create_recipes(self.author, 1)
+        self.author_client = APIClient()
+        self.author_client.force_authenticate(self.author)
+        self.urls = ('/api/recipes/', '/api/recipes/?author=author')
+        for url in self.urls:
+            self.assertCache(url, 'MISS')
+            self.assertCache(url, 'HIT')
+
+    def assertCache(self, url, status):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Cache'], status, url)
+
+    def assertInvalidated(self, *urls):
+        for url in urls or self.urls:
+            self.assertCache(url, 'MISS')
+
+    def test_create(self):
+        response = self.author_client.post('/api/recipes/', {
+            'ingredients': [
+                {'id': Ingredient.objects.first().pk, 'amount': 1}],
+            'tags': [Tag.objects.first().pk],
+            'image': get_image_data(),
+            'name': 'Рецепт',
+            'text': 'Описание',
+            'cooking_time': 10,
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertInvalidated()
+
+    def test_update(self):
+        response = self.author_client.patch(
+            f'/api/recipes/{self.recipe.pk}/', {
+                'ingredients': [
+                    {'id': Ingredient.objects.first().pk, 'amount': 5}],
+                'tags': [Tag.objects.first().pk],
+                'name': 'Новое название',
+            }, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertInvalidated()
+
+    def test_delete(self):
+        response = self.author_client.delete(
+            f'/api/recipes/{self.recipe.pk}/')
+        self.assertEqual(response.status_code, 204)
+        self.assertInvalidated()
+
+    def test_author_rename(self):
+        self.author.first_name = 'Имя'
+        self.author.save()
+        self.assertInvalidated()
+        self.author.username = 'renamed'
+        self.author.save()
+        self.assertInvalidated('/api/recipes/?author=renamed')
+        self.assertCache('/api/recipes/?author=author', 'MISS')
+
+    def test_author_delete(self):
+        self.create_recipes(self.author, 4)
+        with CaptureQueriesContext(connection) as context:
+            self.author.delete()
+        # Username автора не запрашивается для каждого удаленного рецепта
+        self.assertFalse([
+            query['sql'] for query in context.captured_queries
+            if query['sql'].startswith('SELECT')
+            and '"users_user"."id" = ' in query['sql']])
+        self.assertInvalidated()
+
+
+class TagCacheTest(ApiTestMixin, TransactionTestCase):
+    """Кеш справочника тегов сбрасывается после фиксации изменения."""
+
+    def test_etag_changes_after_commit(self):
+        tag = Tag.objects.create(name='Завтрак', color='#000001', slug='b')
+        etag = self.client.get('/api/tags/')['ETag']
+        with transaction.atomic():
+            tag.name = 'Обед'
+            tag.save()
+            # До фиксации версия прежняя: ответ из кеша, новые данные
+            # не попадают в кеш раньше, чем их увидят другие процессы
+            response = self.client.get('/api/tags/')
+            self.assertEqual(response['ETag'], etag)
+            self.assertEqual(response.data[0]['name'], 'Завтрак')
+        response = self.client.get('/api/tags/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data[0]['name'], 'Обед')
+
+
+class QueryPlansTest(ApiTestCase):
+    """
+    Регрессионная проверка индексов. На тестовых данных выполняются
+    основные запросы api (фильтры списка рецептов, подписки, список
+    покупок): для каждого SELECT строится план (EXPLAIN), ни одна
+    таблица не должна просматриваться целиком, а запросов к базе должно
+    быть не больше допустимого (query_budget). В PostgreSQL полный
+    просмотр запрещен (enable_seqscan = off), поэтому Seq Scan в плане
+    означает, что подходящего индекса нет.
+    """
+
+    users_count = 100
+    recipes_count = 1000
+    # Проверяемые запросы: (название, url, допустимое число запросов).
+    # {author} и {tag} - из тестовых данных, запросы выполняет
+    # пользователь с избранным, списком покупок и подписками
+    checks = (
+        ('Список рецептов', '/api/recipes/', 8),
+        ('Список рецептов, курсор', '/api/recipes/?cursor=', 7),
+        ('Рецепты автора', '/api/recipes/?author={author}', 8),
+        ('Рецепты с тегом', '/api/recipes/?tags={tag}', 9),
+        ('Популярные рецепты', '/api/recipes/?ordering=popular', 8),
+        ('Избранное', '/api/recipes/?is_favorited=1', 8),
+        ('Рецепты в списке покупок',
+         '/api/recipes/?is_in_shopping_cart=1', 8),
+        ('Подписки', '/api/users/subscriptions/', 4),
+        ('Скачать список покупок',
+         '/api/recipes/download_shopping_cart/?type=txt', 1),
+    )
+    # Маленькие справочники просматриваются целиком
+    ignored_tables = ('recipes_tag',)
+
+    def setUp(self):
+        super().setUp()
+        self.user, self.author, self.tag = self.seed()
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+            if connection.vendor == 'postgresql':
+                # До конца транзакции теста
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        self.client.force_authenticate(self.user)
+
+    def seed(self):
+        """
+        Пользователи, рецепты со связями, избранное, список покупок
+        и подписки. Возвращает пользователя для запросов, автора и тег.
+        """
+        User.objects.bulk_create(
+            User(
+                username=f'user_{number}', email=f'user_{number}@localhost',
+                password='!')
+            for number in range(self.users_count))
+        # bulk_create в SQLite не возвращает pk
+        users = list(User.objects.order_by('pk'))
+        tags = [
+            Tag.objects.create(
+                name=f'Тег {number}', color=f'#{number:06}',
+                slug=f'tag_{number}')
+            for number in range(10)
+        ]
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'Ингридиент {number}', measurement_unit='г')
+            for number in range(500))
+        ingredients = list(Ingredient.objects.order_by('pk'))
+        Recipe.objects.bulk_create(
+            Recipe(
+                author=users[number % len(users)], name=f'Рецепт {number}',
+                text='Описание', cooking_time=settings.MIN_COOKING_TIME,
+                image='recipes/image/test.png')
+            for number in range(self.recipes_count))
+        recipes = list(Recipe.objects.order_by('pk'))
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                recipe=recipe,
+                ingredient=ingredients[(number + shift) % len(ingredients)],
+                count=shift + 1)
+            for number, recipe in enumerate(recipes) for shift in range(5))
+        RecipeTag.objects.bulk_create(
+            RecipeTag(recipe=recipe, tag=tags[(number + shift) % len(tags)])
+            for number, recipe in enumerate(recipes) for shift in range(2))
+        for model in (Favorite, ShoppingCart):
+            model.objects.bulk_create(
+                model(user=user, recipe=recipes[(number * 7 + shift) %
+                                                len(recipes)])
+                for number, user in enumerate(users) for shift in range(20))
+        Follow.objects.bulk_create(
+            Follow(user=user, author=users[(number + shift) % len(users)])
+            for number, user in enumerate(users) for shift in range(1, 11))
+        return users[0], users[1], tags[0]
+
+    def get_seq_scans(self, sql):
+        """Таблицы, которые запрос sql просматривает целиком, и план."""
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute('EXPLAIN (FORMAT JSON) ' + sql)
+                plan = cursor.fetchone()[0][0]['Plan']
+                nodes, tables, lines = [plan], [], []
+                while nodes:
+                    node = nodes.pop()
+                    nodes.extend(node.get('Plans', ()))
+                    lines.append(
+                        f"{node['Node Type']} {node.get('Relation Name', '')}")
+                    if node['Node Type'] == 'Seq Scan':
+                        tables.append(node['Relation Name'])
+                return tables, lines
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+            lines = [row[-1] for row in cursor.fetchall()]
+        tables = [
+            match.group(1) for match in map(SQLITE_SCAN.match, lines)
+            if match]
+        return tables, lines
+
+    def test_queries_use_indexes(self):
+        # В плане SQLite просмотр подзапроса выглядит как просмотр таблицы
+        checked_tables = set(connection.introspection.table_names())
+        checked_tables.difference_update(self.ignored_tables)
+        for name, url, budget in self.checks:
+            with self.subTest(name):
+                with query_budget(budget) as context:
+                    response = self.client.get(url.format(
+                        author=self.author.username, tag=self.tag.slug))
+                self.assertEqual(response.status_code, 200)
+                plans = []
+                for query in context.captured_queries:
+                    if not query['sql'].lstrip().upper().startswith(
+                            'SELECT'):
+                        continue
+                    tables, lines = self.get_seq_scans(query['sql'])
+                    if checked_tables.intersection(tables):
+                        plans.append('\n'.join((query['sql'], *lines)))
+                self.assertEqual(plans, [], '\n\n'.join(plans))
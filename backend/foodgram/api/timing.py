@@ -0,0 +1,159 @@
+"""
+Замеры запросов к api: число и время SQL-запросов, время Python
+и сериализаторов. Включаются настройкой REQUEST_TIMING, результат -
+заголовок Server-Timing (виден в DevTools браузера) и строка JSON
+в логе api.timing с именем представления и действия DRF:
+{"view": "RecipesViewSet.list", "status": 200, "queries": 8, ...}
+Время сериализаторов замеряется подменой BaseSerializer.data
+(install), которую при REQUEST_TIMING выполняет ApiConfig.ready.
+"""
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.test.utils import CaptureQueriesContext
+from rest_framework.serializers import BaseSerializer
+
+API_PREFIX = '/api/'
+QUERY_BUDGET_ERROR = 'Запросов к базе {count}, допустимо {budget}:\n{queries}'
+
+logger = logging.getLogger(__name__)
+# Замеры текущего запроса (gunicorn обрабатывает запрос в одном потоке)
+state = threading.local()
+original_serializer_data = BaseSerializer.data.fget
+
+
+def serializer_data(self):
+    """
+    BaseSerializer.data с замером времени. Учитывается только внешний
+    сериализатор: ListSerializer.data вызывает BaseSerializer.data.
+    Время включает SQL-запросы, выполненные при сериализации.
+    """
+    timings = getattr(state, 'timings', None)
+    if timings is None or timings.serializer_depth:
+        return original_serializer_data(self)
+    timings.serializer_depth += 1
+    started = time.perf_counter()
+    try:
+        return original_serializer_data(self)
+    finally:
+        timings.serializer_time += time.perf_counter() - started
+        timings.serializer_depth -= 1
+
+
+def install():
+    """
+    Подменить BaseSerializer.data на serializer_data для всех
+    сериализаторов процесса. Вне запросов с замером подмена только
+    вызывает исходное свойство. Повторный вызов ничего не меняет.
+    """
+    BaseSerializer.data = property(serializer_data)
+
+
+def uninstall():
+    """Вернуть исходное BaseSerializer.data."""
+    BaseSerializer.data = property(original_serializer_data)
+
+
+class RequestTimings:
+    """Замеры одного запроса."""
+
+    def __init__(self):
+        self.view = None
+        self.queries = 0
+        self.sql_time = 0.0
+        self.serializer_time = 0.0
+        self.serializer_depth = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        # connection.execute_wrapper: каждый запрос к базе
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_time += time.perf_counter() - started
+            self.queries += 1
+
+
+def get_view_name(view_func, method):
+    """RecipesViewSet.list, Subscriptions.get, download_shopping_cart.get"""
+    view_class = getattr(view_func, 'cls', None)
+    if view_class is None:
+        return view_func.__name__
+    # У ViewSet actions: {'get': 'list'}; у @api_view имя класса -
+    # имя функции
+    action = getattr(view_func, 'actions', None) or {}
+    return f'{view_class.__name__}.{action.get(method, method)}'
+
+
+class RequestTimingMiddleware:
+    """
+    Замеры запросов к /api/ (при REQUEST_TIMING = True).
+    Время сериализаторов - 0, если не вызван install.
+    """
+
+    def __init__(self, get_response):
+        if not settings.REQUEST_TIMING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not request.path.startswith(API_PREFIX):
+            return self.get_response(request)
+        timings = state.timings = RequestTimings()
+        started = time.perf_counter()
+        try:
+            with connection.execute_wrapper(timings):
+                response = self.get_response(request)
+        finally:
+            state.timings = None
+        total = time.perf_counter() - started
+        # Время Python (включая сериализаторы) - все, кроме SQL
+        python_time = total - timings.sql_time
+        response['Server-Timing'] = ', '.join((
+            f'db;dur={timings.sql_time * 1000:.1f};'
+            f'desc="SQL ({timings.queries})"',
+            f'serializer;dur={timings.serializer_time * 1000:.1f}',
+            f'python;dur={python_time * 1000:.1f}',
+            f'total;dur={total * 1000:.1f}',
+        ))
+        logger.info(json.dumps({
+            'view': timings.view,
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'queries': timings.queries,
+            'sql_ms': round(timings.sql_time * 1000, 1),
+            'serializer_ms': round(timings.serializer_time * 1000, 1),
+            'python_ms': round(python_time * 1000, 1),
+            'total_ms': round(total * 1000, 1),
+        }))
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        timings = getattr(state, 'timings', None)
+        if timings is not None:
+            timings.view = get_view_name(view_func, request.method.lower())
+
+
+@contextmanager
+def query_budget(budget, using=DEFAULT_DB_ALIAS):
+    """
+    Проверка, что блок выполняет не больше budget запросов к базе
+    (для тестов). При превышении - AssertionError
+    со списком запросов.
+    with query_budget(8):
+        client.get('/api/recipes/')
+    """
+    with CaptureQueriesContext(connections[using]) as context:
+        yield context
+    if len(context) > budget:
+        raise AssertionError(QUERY_BUDGET_ERROR.format(
+            count=len(context), budget=budget,
+            queries='\n'.join(
+                query['sql'] for query in context.captured_queries)))
@@ -1,8 +1,8 @@
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
-from api.views import (CustomAuthToken, download_shopping_cart,
-                       IngredientsViewSet, logout, RecipesViewSet,
+from api.views import (cache_stats, CustomAuthToken, download_shopping_cart,
+                       IngredientsViewSet, JobViewSet, logout, RecipesViewSet,
                        set_password, ShoppingCartViewSet, Subscribe,
                        Subscriptions, TagsViewSet, UserViewSet)
 
@@ -16,6 +16,7 @@ router_v1.register(
 )
 router_v1.register('ingredients', IngredientsViewSet, basename='ingredients')
 router_v1.register('users', UserViewSet, basename='users')
+router_v1.register('jobs', JobViewSet, basename='jobs')
 
 urlpatterns = [
     path(
@@ -42,5 +43,9 @@ urlpatterns = [
         'recipes/download_shopping_cart/',
         download_shopping_cart,
         name='download_shopping_cart'),
+    path(
+        'cache/stats/',
+        cache_stats,
+        name='cache_stats'),
     path('', include(router_v1.urls))
 ]
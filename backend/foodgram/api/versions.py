@@ -0,0 +1,36 @@
+"""
+Версии данных, общие для всех процессов gunicorn.
+Версия - время изменения файла-метки в CACHE_DIR/versions, поэтому
+проверка актуальности кеша в процессе стоит один вызов stat,
+а не запрос к базе данных.
+"""
+import os
+import time
+
+from django.conf import settings
+
+# Справочники, изменение которых отслеживается версией
+TAGS_VERSION = 'tags'
+INGREDIENTS_VERSION = 'ingredients'
+
+
+def get_version_path(name):
+    return os.path.join(settings.CACHE_DIR, 'versions', name)
+
+
+def get_version(name):
+    """Текущая версия (0, если данные еще не менялись)."""
+    try:
+        return os.stat(get_version_path(name)).st_mtime_ns
+    except FileNotFoundError:
+        return 0
+
+
+def bump_version(name):
+    """Отметить изменение данных. Кеши всех процессов станут устаревшими."""
+    path = get_version_path(name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    version = max(time.time_ns(), get_version(name) + 1)
+    with open(path, 'a'):
+        os.utime(path, ns=(version, version))
+    return version
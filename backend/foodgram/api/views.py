@@ -1,21 +1,26 @@
+from django.contrib.auth import authenticate
 from django.contrib.auth.hashers import check_password
-from django.http import HttpResponse
+from django.db.models import Prefetch, Sum
+from django.http import FileResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import status
 from rest_framework.authtoken.models import Token
 from rest_framework.authtoken.views import ObtainAuthToken
-from rest_framework.decorators import action, api_view
+from rest_framework.decorators import (action, api_view,
+                                       permission_classes)
 from rest_framework.generics import ListAPIView
 from rest_framework.mixins import (CreateModelMixin, DestroyModelMixin,
                                    ListModelMixin, RetrieveModelMixin)
-from rest_framework.permissions import (AllowAny, IsAuthenticated,
+from rest_framework.permissions import (AllowAny, IsAdminUser,
+                                        IsAuthenticated,
                                         IsAuthenticatedOrReadOnly)
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.viewsets import (GenericViewSet, ModelViewSet,
                                      ReadOnlyModelViewSet)
 
+from api.authentication import invalidate, token_cache
 from api.constants import (ADD_RECIPE_IN_FAVORITE_ERROR,
                            DELETE_SHOPPING_CART_ERROR,
                            DELETE_SHOPPING_CART_RECIPES_ERROR,
@@ -23,40 +28,53 @@ from api.constants import (ADD_RECIPE_IN_FAVORITE_ERROR,
                            FOLLOW_NOT_EXIST_ERROR,
                            RECIPE_IN_FAVORITE_EXIST_ERROR,
                            RECIPE_IN_FAVORITE_NOT_EXIST_ERROR,
-                           RECIPES_ID_ERROR)
-from api.filters import IngredientFilter, RecipeFilter
+                           RECIPES_ID_ERROR, SHOPPING_LIST_TYPE_ERROR)
+from api.filters import (IngredientFilter, POPULAR, POPULAR_ORDERING,
+                         RecipeFilter)
+from api.mixins import (CatalogCacheMixin, ConditionalRecipeMixin,
+                        RecipeListCacheMixin)
 from api.pagination import CustomPagination
 from api.permissions import AdminOrAuthorOrReadOnly, AdminOrReadOnly
+from api.recipe_cache import recipe_list_cache
 from api.serializers import (FollowSerializer, FollowSerializerSuscribe,
-                             IngredientSerializer, RecipeFavoriteSerializer,
+                             IngredientSerializer, JobSerializer,
+                             RecipeFavoriteSerializer,
                              RecipeSerializer, SetPasswordSerializer,
                              ShoppingCartSerializer, TagSerializer,
                              UserCreateSerializer, UserSerializer,
                              UserSerializerExtended)
+from api.shopping_list import (RENDERERS, get_cache_path, open_cached,
+                               render_to_cache)
+from api.versions import INGREDIENTS_VERSION, TAGS_VERSION
+from jobs.models import Job
+from jobs.registry import enqueue
 from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
                             ShoppingCart, Tag)
 from users.models import Follow, User
 
 
-class TagsViewSet(ReadOnlyModelViewSet):
+class TagsViewSet(CatalogCacheMixin, ReadOnlyModelViewSet):
     """Работа с тегами."""
 
+    catalog_version = TAGS_VERSION
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = (AdminOrReadOnly,)
 
 
-class IngredientsViewSet(ReadOnlyModelViewSet):
+class IngredientsViewSet(CatalogCacheMixin, ReadOnlyModelViewSet):
     """Работа с ингридентами."""
 
+    catalog_version = INGREDIENTS_VERSION
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = (AdminOrReadOnly,)
     filter_backends = (IngredientFilter,)
-    search_fields = ('^name',)
 
 
-class RecipesViewSet(ModelViewSet):
+class RecipesViewSet(
+    RecipeListCacheMixin, ConditionalRecipeMixin, ModelViewSet
+):
     """Работа с рецептами."""
 
     queryset = Recipe.objects.all()
@@ -66,6 +84,47 @@ class RecipesViewSet(ModelViewSet):
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
 
+    @property
+    def cursor_ordering(self):
+        """
+        Порядок для курсорной пагинации (?cursor=): как у модели Recipe
+        или по популярности (?ordering=popular).
+        """
+        if self.request.query_params.get('ordering') == POPULAR:
+            return POPULAR_ORDERING
+        return ('pub_date', 'id')
+
+    def get_queryset(self):
+        """
+        Рецепты вместе со всеми связями, которые нужны RecipeSerializer.
+        Количество запросов не зависит от размера страницы:
+        автор подтягивается через JOIN, ингридиенты и теги - prefetch,
+        флаги избранного, списка покупок и подписки - из UserRelations.
+        """
+        return Recipe.objects.select_related('author').prefetch_related(
+            Prefetch(
+                'recipeingredient_set',
+                queryset=RecipeIngredient.objects.select_related('ingredient')
+            ),
+            'tags'
+        )
+
+    def perform_create(self, serializer):
+        serializer.save()
+        self.reload_instance(serializer)
+
+    def perform_update(self, serializer):
+        serializer.save()
+        self.reload_instance(serializer)
+
+    def reload_instance(self, serializer):
+        """
+        Ответ на POST / PATCH строится по рецепту, загруженному
+        get_queryset: без запроса на каждый ингридиент.
+        """
+        serializer.instance = self.get_queryset().get(
+            pk=serializer.instance.pk)
+
     def get_permissions(self):
         """Выбор permission."""
         if self.action == 'create':
@@ -141,20 +200,21 @@ class Subscriptions(ListAPIView):
     """Работа со списком подписки."""
 
     # Переопределяем поля класса ListAPIView -> GenericAPIView
+    serializer_class = FollowSerializer
     pagination_class = CustomPagination
     permission_classes = (IsAuthenticated, )
+    cursor_ordering = ('-id',)
 
-    def get(self, request):
-        following = []
-        for object in Follow.objects.filter(user=request.user):
-            following.append(object.author)
-        # Для работы пагинации используем методы класса ListAPIView
-        page = self.paginate_queryset(following)
-        serializer = FollowSerializer(
-            page, many=True, context={'request': request}
-        )
-        # Для работы пагинации используем методы класса ListAPIView
-        return self.get_paginated_response(serializer.data)
+    def get_queryset(self):
+        """
+        Авторы, на которых подписан пользователь.
+        Пагинация выполняется в базе, recipes_count хранится в модели User,
+        рецепты авторов страницы загружает FollowSerializer.
+        Порядок как у модели Follow: сначала авторы с большим id.
+        """
+        return User.objects.filter(
+            following__user=self.request.user
+        ).order_by('-id')
 
 
 class Subscribe(APIView):
@@ -200,6 +260,7 @@ class UserViewSet(
     queryset = User.objects.all()
     pagination_class = CustomPagination
     permission_classes = (IsAuthenticatedOrReadOnly,)
+    cursor_ordering = ('id',)
 
     def get_serializer_class(self):
         """Выбор сериализатора."""
@@ -227,30 +288,53 @@ class UserViewSet(
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 
+class JobViewSet(ListModelMixin, RetrieveModelMixin, GenericViewSet):
+    """
+    Статус фоновых задач пользователя (администратор видит все).
+    GET http://127.0.0.1:8000/api/jobs/{id}/
+    POST http://127.0.0.1:8000/api/jobs/recount_counters/
+    """
+
+    serializer_class = JobSerializer
+    pagination_class = CustomPagination
+    permission_classes = (IsAuthenticated,)
+
+    def get_queryset(self):
+        if self.request.user.is_staff:
+            return Job.objects.all()
+        return Job.objects.filter(user=self.request.user)
+
+    @action(
+        methods=['POST'], url_path='recount_counters', detail=False,
+        permission_classes=(IsAdminUser,)
+    )
+    def recount_counters(self, request):
+        """Пересчет счетчиков избранного и рецептов в очереди jobs."""
+        job = enqueue('recount_counters', user=request.user)
+        serializer = self.get_serializer(job)
+        return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
+
+
 class CustomAuthToken(ObtainAuthToken):
     """Собственная реализация контроллера выдачи токенов."""
 
     def post(self, request, *args, **kwargs):
-        if not User.objects.filter(
-            email=request.data.get('email'),
-        ).exists() or 'username' in request.data:
+        # Пароль проверяется один раз - в EmailBackend
+        user = None
+        if 'username' not in request.data:
+            user = authenticate(
+                request,
+                email=request.data.get('email'),
+                password=request.data.get('password'))
+        if user is None:
             return Response(
                 {'field_errors': [ERROR_MESSAGE_FOR_USERNAME]},
                 status=status.HTTP_401_UNAUTHORIZED
             )
-        user = User.objects.get(
-            email=request.data['email'])
-        if not check_password(request.data.get('password'), user.password):
-            return Response(
-                {'field_errors': [ERROR_MESSAGE_FOR_USERNAME]},
-                status=status.HTTP_401_UNAUTHORIZED
-            )
-        request.data['username'] = user.username
-        serializer = self.serializer_class(data=request.data,
-                                           context={'request': request})
-        serializer.is_valid(raise_exception=True)
-        user = serializer.validated_data['user']
-        token, created = Token.objects.get_or_create(user=user)
+        # Токен прочитан вместе с пользователем (select_related)
+        token = getattr(user, 'auth_token', None)
+        if token is None:
+            token, created = Token.objects.get_or_create(user=user)
         return Response({
             'auth_token': token.key
         })
@@ -276,7 +360,10 @@ def set_password(request):
                 status=status.HTTP_400_BAD_REQUEST
             )
         user.set_password(serializer.validated_data['new_password'])
-        user.save()
+        # request.user может быть копией из кеша токенов: сохраняется
+        # только пароль, копия в кеше больше не используется
+        user.save(update_fields=['password'])
+        invalidate(user.pk)
         return Response(status=status.HTTP_204_NO_CONTENT)
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -296,20 +383,48 @@ def download_shopping_cart(request):
         return Response(
             {'detail': 'Учетные данные не были предоставлены.'},
             status=status.HTTP_401_UNAUTHORIZED)
-    ingredient_list = 'Cписок покупок:'
+    # GET query parameter <type> - формат файла: pdf (по умолчанию), csv, txt
+    renderer = RENDERERS.get(request.query_params.get('type', 'pdf'))
+    if renderer is None:
+        return Response(
+            SHOPPING_LIST_TYPE_ERROR, status=status.HTTP_400_BAD_REQUEST)
     # RecipeIngredient (recipe) ->
     # Recipe (recipe_in_cart - related поле, указывающее на ShoppingCart) ->
     # ShoppingCart (user)
-    ingredients_in_cart = RecipeIngredient.objects.filter(
-        recipe__recipe_in_cart__user=request.user)
-    dictionary = {}
-    for ingredient in ingredients_in_cart:
-        dictionary[ingredient.ingredient.name] = dictionary.get(
-            ingredient.ingredient.name, 0) + ingredient.count
-    for ingredient, count in dictionary.items():
-        measurement_unit = Ingredient.objects.get(
-            name=ingredient).measurement_unit
-        ingredient_list += f'\n {ingredient} ---> {count} ({measurement_unit})'
-    response = HttpResponse(ingredient_list, 'Content-Type: application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="{FILE_NAME}.pdf"'
+    # Суммирование выполняется в базе одним запросом с GROUP BY
+    ingredients = tuple(RecipeIngredient.objects.filter(
+        recipe__recipe_in_cart__user=user
+    ).values(
+        'ingredient__id', 'ingredient__name', 'ingredient__measurement_unit'
+    ).annotate(
+        amount=Sum('count')
+    ).order_by(
+        'ingredient__name', 'ingredient__measurement_unit'
+    ).values_list(
+        'ingredient__name', 'ingredient__measurement_unit', 'amount'))
+    path = get_cache_path(renderer, ingredients)
+    file = open_cached(path)
+    if file is not None:
+        response = FileResponse(file, content_type=renderer.content_type)
+    else:
+        response = StreamingHttpResponse(
+            render_to_cache(renderer, ingredients, path),
+            content_type=renderer.content_type)
+    response['Content-Disposition'] = (
+        f'attachment; filename="{FILE_NAME}.{renderer.extension}"')
     return response
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def cache_stats(request):
+    """
+    Статистика кешей текущего процесса gunicorn (для настройки).
+    Размер, попадания, промахи и доля попаданий.
+    """
+    return Response({
+        'recipes': recipe_list_cache.stats(),
+        'tags': TagsViewSet.catalog_cache.stats(),
+        'ingredients': IngredientsViewSet.catalog_cache.stats(),
+        'tokens': token_cache.stats(),
+    })
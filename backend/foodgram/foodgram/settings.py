@@ -22,12 +22,16 @@ INSTALLED_APPS = [
     'api.apps.ApiConfig',
     # Приложение recipes
     'recipes.apps.RecipesConfig',
+    # Приложение jobs (фоновые задачи)
+    'jobs.apps.JobsConfig',
     'rest_framework',
     'corsheaders',
     'django_filters',
     'rest_framework.authtoken',
 ]
 MIDDLEWARE = [
+    # Первым: замер включает остальные middleware
+    'api.timing.RequestTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -103,13 +107,80 @@ MEDIA_URL = '/media/'
 # MEDIA_URL = 'http://localhost:8000/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 AUTH_USER_MODEL = 'users.User'
+# Вход в api по email, в админку - по username
+AUTHENTICATION_BACKENDS = [
+    'users.backends.EmailBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
+# Каталог для файлов кеша (общий для всех процессов gunicorn)
+CACHE_DIR = os.getenv('CACHE_DIR', default=os.path.join(BASE_DIR, 'cache'))
+# Готовые файлы списка покупок
+SHOPPING_LIST_CACHE_DIR = os.path.join(CACHE_DIR, 'shopping_list')
+# Наибольшее число файлов списка покупок в кеше: при записи нового файла
+# удаляются файлы, которые дольше всего не скачивали
+SHOPPING_LIST_CACHE_MAX_FILES = 1000
+# Снимок индекса ингридиентов (общий для процессов gunicorn)
+INGREDIENT_INDEX_SNAPSHOT = os.path.join(CACHE_DIR, 'ingredient_index.json')
+# Время жизни индекса ингридиентов (секунды): обновление рейтинга по рецептам
+INGREDIENT_INDEX_TTL = 600
+# Режим поиска ингридиентов по умолчанию: prefix или infix
+INGREDIENT_SEARCH_MODE = 'infix'
+# Минимальная длина строки для поиска по подстроке (размер триграммы)
+INGREDIENT_INFIX_MIN_LENGTH = 3
+# Кеш ответов справочников (теги, ингридиенты): число записей и время жизни
+CATALOG_CACHE_SIZE = 1024
+CATALOG_CACHE_TTL = 600
+# Кеш страниц списка рецептов для анонимных пользователей
+RECIPE_LIST_CACHE_SIZE = 512
+RECIPE_LIST_CACHE_TTL = 300
+# Кеш токенов (токен -> пользователь): число записей и время жизни
+TOKEN_CACHE_SIZE = 4096
+TOKEN_CACHE_TTL = 60
+# Наибольший размер загружаемой картинки рецепта, байт
+MAX_IMAGE_SIZE = 5 * 1024 * 1024
+# Тело запроса с картинкой в base64 (+ остальные поля рецепта),
+# в nginx.conf client_max_body_size не меньше
+DATA_UPLOAD_MAX_MEMORY_SIZE = MAX_IMAGE_SIZE * 4 // 3 + 64 * 1024
+# Миниатюры картинок рецептов: рамка (ширина, высота) для каждого размера
+# card - карточки в списке рецептов, list - рецепты в списке подписок
+RECIPE_THUMBNAIL_SIZES = {
+    'card': (480, 480),
+    'list': (160, 160),
+}
+# Число потоков, в которых строятся миниатюры
+THUMBNAIL_WORKERS = 2
+# Где строятся миниатюры: threads - пул потоков процесса gunicorn,
+# jobs - очередь фоновых задач (нужен manage.py run_workers)
+THUMBNAIL_QUEUE = os.getenv('THUMBNAIL_QUEUE', default='threads')
+# Очередь фоновых задач: число процессов run_workers, через сколько
+# секунд незавершенная задача выдается снова, период опроса очереди
+JOB_WORKERS = 2
+JOB_VISIBILITY_TIMEOUT = 300
+JOB_POLL_INTERVAL = 1.0
+# Замеры запросов к api (число и время SQL, время Python и сериализаторов):
+# заголовок Server-Timing и строка JSON в логе api.timing
+REQUEST_TIMING = bool(os.getenv('REQUEST_TIMING'))
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'api.timing': {'handlers': ['console'], 'level': 'INFO'},
+    },
+}
+# TrueType шрифт с кириллицей для списка покупок в pdf
+SHOPPING_LIST_FONT = os.getenv(
+    'SHOPPING_LIST_FONT',
+    default='/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf')
 # Работа с токенами
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ],
 }
 # CORS_ORIGIN_ALLOW_ALL = True
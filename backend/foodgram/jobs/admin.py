@@ -0,0 +1,21 @@
+from django.contrib import admin
+
+from jobs.models import Job
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = (
+        'pk',
+        'name',
+        'status',
+        'attempts',
+        'user',
+        'created_at',
+        'finished_at'
+    )
+    list_select_related = ('user',)
+    list_filter = ('status', 'name')
+    search_fields = ('name',)
+    autocomplete_fields = ('user',)
+    readonly_fields = ('created_at', 'finished_at')
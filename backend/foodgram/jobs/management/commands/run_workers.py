@@ -0,0 +1,81 @@
+import multiprocessing
+import signal
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from jobs.worker import claim_job, execute_job
+
+HELP_MESSAGE = 'Запуск обработчиков очереди фоновых задач'
+START_MESSAGE = 'Запущено обработчиков: {processes}'
+STOP_MESSAGE = 'Обработчики остановлены.'
+
+
+def work(stop, visibility_timeout, poll_interval, once):
+    """Цикл обработчика в отдельном процессе."""
+    # Остановка по SIGTERM / Ctrl+C - через общий флаг stop,
+    # текущая задача выполняется до конца
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    while not stop.is_set():
+        job = claim_job(visibility_timeout)
+        if job is None:
+            if once:
+                break
+            stop.wait(poll_interval)
+            continue
+        execute_job(job)
+    connections.close_all()
+
+
+class Command(BaseCommand):
+    """
+    Обработчики очереди фоновых задач (модель Job) в пуле процессов.
+    Задачи выполняются вне gunicorn, запросы пользователей их не ждут.
+    python manage.py run_workers --processes 2
+    python manage.py run_workers --once  # выполнить очередь и выйти
+    Повтор после ошибки откладывается: 2, 4, 8... секунд.
+    """
+
+    help = HELP_MESSAGE
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes', type=int, default=settings.JOB_WORKERS)
+        parser.add_argument(
+            '--visibility-timeout', type=int,
+            default=settings.JOB_VISIBILITY_TIMEOUT,
+            help='Через сколько секунд незавершенная задача '
+                 'выдается снова.')
+        parser.add_argument(
+            '--poll-interval', type=float,
+            default=settings.JOB_POLL_INTERVAL)
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Выйти, когда не останется задач, готовых к выполнению.')
+
+    def handle(self, *args, **options):
+        # Соединения с базой не должны наследоваться дочерними процессами
+        connections.close_all()
+        # fork: дочерние процессы получают настроенный Django
+        context = multiprocessing.get_context('fork')
+        stop = context.Event()
+        for signal_number in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signal_number, lambda *args: stop.set())
+        processes = [
+            context.Process(
+                target=work,
+                args=(
+                    stop, options['visibility_timeout'],
+                    options['poll_interval'], options['once']),
+                daemon=True)
+            for _ in range(options['processes'])
+        ]
+        for process in processes:
+            process.start()
+        self.stdout.write(START_MESSAGE.format(**options))
+        while any(process.is_alive() for process in processes):
+            time.sleep(0.2)
+        self.stdout.write(self.style.SUCCESS(STOP_MESSAGE))
@@ -0,0 +1,94 @@
+from django.db import models
+
+from users.models import User
+
+
+class Job(models.Model):
+    """
+    Фоновая задача в очереди (см. jobs/worker.py).
+    Аргументы и результат хранятся в JSON, поэтому очередь работает
+    и на PostgreSQL, и на SQLite.
+    """
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = (
+        (QUEUED, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (DONE, 'Выполнена'),
+        (FAILED, 'Ошибка'),
+    )
+
+    name = models.CharField(
+        'Задача',
+        max_length=100
+    )
+    payload = models.TextField(
+        'Аргументы (JSON)',
+        default='{}'
+    )
+    status = models.CharField(
+        'Статус',
+        max_length=10,
+        choices=STATUSES,
+        default=QUEUED
+    )
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='jobs',
+        verbose_name='Пользователь'
+    )
+    attempts = models.PositiveIntegerField(
+        'Попыток',
+        default=0
+    )
+    max_attempts = models.PositiveIntegerField(
+        'Наибольшее число попыток',
+        default=3
+    )
+    # Не раньше этого времени (повтор после ошибки откладывается)
+    run_after = models.DateTimeField(
+        'Выполнить после'
+    )
+    # Выполняющаяся задача, не завершенная к этому времени,
+    # считается потерянной и снова выдается обработчику
+    locked_until = models.DateTimeField(
+        'Заблокирована до',
+        null=True,
+        blank=True
+    )
+    result = models.TextField(
+        'Результат (JSON)',
+        blank=True
+    )
+    error = models.TextField(
+        'Ошибка',
+        blank=True
+    )
+    created_at = models.DateTimeField(
+        'Дата создания',
+        auto_now_add=True
+    )
+    finished_at = models.DateTimeField(
+        'Дата завершения',
+        null=True,
+        blank=True
+    )
+
+    class Meta:
+        ordering = ('pk',)
+        verbose_name = 'задачу'
+        verbose_name_plural = '1. Фоновые задачи'
+        indexes = [
+            # Выборка задач обработчиком
+            models.Index(
+                fields=['status', 'run_after'], name='job_queue_idx')
+        ]
+
+    def __str__(self):
+        return f'{self.name} #{self.pk} ({self.status})'
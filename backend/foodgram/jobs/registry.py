@@ -0,0 +1,45 @@
+"""
+Реестр фоновых задач.
+Задача - функция из модуля tasks.py приложения, помеченная @task.
+Аргументы и возвращаемое значение должны сериализоваться в JSON.
+
+    @task('build_thumbnails')
+    def build(recipe_id, image_name):
+        ...
+
+    enqueue('build_thumbnails', recipe_id=1, image_name='...')
+"""
+import json
+
+from django.utils import timezone
+
+from jobs.models import Job
+
+TASKS = {}
+
+
+def task(name):
+    """Зарегистрировать функцию как задачу name."""
+    def register(function):
+        TASKS[name] = function
+        return function
+    return register
+
+
+def enqueue(name, user=None, max_attempts=None, **kwargs):
+    """Поставить задачу в очередь, вернуть объект Job."""
+    if name not in TASKS:
+        raise KeyError(f'Задача {name} не зарегистрирована')
+    job = Job(
+        name=name, user=user, run_after=timezone.now(),
+        payload=json.dumps(kwargs, ensure_ascii=False))
+    if max_attempts is not None:
+        job.max_attempts = max_attempts
+    job.save()
+    return job
+
+
+def run(job):
+    """Выполнить задачу, вернуть результат в JSON."""
+    result = TASKS[job.name](**json.loads(job.payload))
+    return json.dumps(result, ensure_ascii=False)
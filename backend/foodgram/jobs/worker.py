@@ -0,0 +1,88 @@
+"""
+Обработчик очереди фоновых задач (запуск: manage.py run_workers).
+Задача захватывается условным UPDATE (compare-and-set по статусу
+и времени блокировки), поэтому несколько процессов не выполнят одну
+задачу дважды без блокировок строк - это работает и в SQLite.
+"""
+import datetime
+import logging
+import traceback
+
+from django.db.models import F, Q
+from django.utils import timezone
+
+from jobs import registry
+from jobs.models import Job
+
+# Сколько задач-кандидатов выбирается за один запрос
+CLAIM_BATCH_SIZE = 10
+
+logger = logging.getLogger(__name__)
+
+
+def claim_job(visibility_timeout):
+    """
+    Захватить задачу из очереди или None, если очередь пуста.
+    Выдаются задачи в очереди, срок которых наступил, и выполняющиеся
+    задачи с истекшей блокировкой (обработчик завершился аварийно).
+    """
+    now = timezone.now()
+    candidates = Job.objects.filter(
+        Q(status=Job.QUEUED, run_after__lte=now)
+        | Q(status=Job.RUNNING, locked_until__lt=now)
+    ).order_by('run_after', 'pk').values_list(
+        'pk', 'status', 'locked_until')[:CLAIM_BATCH_SIZE]
+    locked_until = now + datetime.timedelta(seconds=visibility_timeout)
+    for pk, status, previous_lock in candidates:
+        claimed = Job.objects.filter(
+            pk=pk, status=status, locked_until=previous_lock
+        ).update(
+            status=Job.RUNNING,
+            locked_until=locked_until,
+            attempts=F('attempts') + 1
+        )
+        if claimed:
+            return Job.objects.get(pk=pk)
+    return None
+
+
+def finish_job(job, **fields):
+    """
+    Сохранить итог задачи, если блокировка еще принадлежит обработчику.
+    Иначе задачу уже выдали другому обработчику - итог отбрасывается.
+    """
+    return Job.objects.filter(
+        pk=job.pk, status=Job.RUNNING, locked_until=job.locked_until
+    ).update(locked_until=None, **fields)
+
+
+def execute_job(job):
+    """Выполнить захваченную задачу: успех, повтор или ошибка."""
+    if job.attempts > job.max_attempts or job.name not in registry.TASKS:
+        error = (
+            f'Задача {job.name} не зарегистрирована'
+            if job.name not in registry.TASKS
+            else 'Превышено время выполнения')
+        finish_job(
+            job, status=Job.FAILED, error=error,
+            finished_at=timezone.now())
+        return
+    try:
+        result = registry.run(job)
+    except Exception:
+        error = traceback.format_exc()
+        logger.warning('Задача %s завершилась ошибкой', job)
+        if job.attempts < job.max_attempts:
+            # Повтор с экспоненциальной задержкой: 2, 4, 8... секунд
+            finish_job(
+                job, status=Job.QUEUED, error=error,
+                run_after=timezone.now() + datetime.timedelta(
+                    seconds=2 ** job.attempts))
+        else:
+            finish_job(
+                job, status=Job.FAILED, error=error,
+                finished_at=timezone.now())
+        return
+    finish_job(
+        job, status=Job.DONE, result=result, error='',
+        finished_at=timezone.now())
@@ -12,8 +12,9 @@ class IngredientAdmin(admin.ModelAdmin):
         'measurement_unit'
     )
     list_editable = ('name', 'measurement_unit')
+    # Используется виджетами автодополнения (autocomplete_fields)
     search_fields = ('name',)
-    list_filter = ('name',)
+    list_filter = ('measurement_unit',)
 
 
 class IngredientInline(admin.TabularInline):
@@ -27,6 +28,12 @@ class IngredientInline(admin.TabularInline):
     model = RecipeIngredient
     # This controls the minimum number of forms to show in the inline
     min_num = 1
+    # Поиск ингридиента вместо select из всего справочника
+    autocomplete_fields = ('ingredient',)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related(
+            'recipe', 'ingredient')
 
 
 @admin.register(Tag)
@@ -48,6 +55,9 @@ class TagInline(admin.TabularInline):
     model = RecipeTag
     min_num = 1
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('recipe', 'tag')
+
 
 @admin.register(Recipe)
 class RecipeAdmin(admin.ModelAdmin):
@@ -61,15 +71,19 @@ class RecipeAdmin(admin.ModelAdmin):
         'count_favorites'
     )
     list_editable = ('name', 'text', 'cooking_time')
-    search_fields = ('name',)
-    list_filter = ('author', 'name', 'tags')
+    list_select_related = ('author',)
+    search_fields = ('name', 'author__username')
+    # Фильтры по автору и названию перечисляли бы все значения из базы
+    list_filter = ('tags',)
+    autocomplete_fields = ('author',)
     # Ссылка на родительский Inline
     inlines = [IngredientInline, TagInline]
 
     def count_favorites(self, obj):
-        return obj.recipe_in_favorite.count()
+        return obj.favorites_count
 
     count_favorites.short_description = 'В избранном'
+    count_favorites.admin_order_field = 'favorites_count'
 
 
 @admin.register(RecipeIngredient)
@@ -80,8 +94,10 @@ class RecipeIngredientAdmin(admin.ModelAdmin):
         'ingredient',
         'count'
     )
-    list_editable = ('recipe', 'ingredient', 'count')
-    search_fields = ('recipe', 'ingredient')
+    list_editable = ('count',)
+    list_select_related = ('recipe', 'ingredient')
+    search_fields = ('recipe__name', 'ingredient__name')
+    autocomplete_fields = ('recipe', 'ingredient')
 
 
 @admin.register(RecipeTag)
@@ -91,8 +107,10 @@ class RecipeTagAdmin(admin.ModelAdmin):
         'recipe',
         'tag'
     )
-    list_editable = ('recipe', 'tag')
-    search_fields = ('recipe', 'tag')
+    list_select_related = ('recipe', 'tag')
+    search_fields = ('recipe__name', 'tag__name')
+    list_filter = ('tag',)
+    autocomplete_fields = ('recipe',)
 
 
 @admin.register(ShoppingCart)
@@ -102,8 +120,9 @@ class ShoppingCartAdmin(admin.ModelAdmin):
         'user',
         'recipe'
     )
-    list_editable = ('user', 'recipe')
-    search_fields = ('user', 'recipe')
+    list_select_related = ('user', 'recipe')
+    search_fields = ('user__username', 'recipe__name')
+    autocomplete_fields = ('user', 'recipe')
 
 
 @admin.register(Favorite)
@@ -113,5 +132,6 @@ class FavoriteAdmin(admin.ModelAdmin):
         'user',
         'recipe'
     )
-    list_editable = ('user', 'recipe')
-    search_fields = ('user', 'recipe')
+    list_select_related = ('user', 'recipe')
+    search_fields = ('user__username', 'recipe__name')
+    autocomplete_fields = ('user', 'recipe')
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class RecipesConfig(AppConfig):
     name = 'recipes'
     verbose_name = 'Рецепты'
+
+    def ready(self):
+        # Подключение обработчиков сигналов (счетчики)
+        from recipes import signals  # noqa: F401
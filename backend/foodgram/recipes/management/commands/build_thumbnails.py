@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from recipes.models import Recipe
+from recipes.thumbnails import build_thumbnails
+
+HELP_MESSAGE = 'Построение миниатюр картинок рецептов'
+ERROR_MESSAGE = 'Рецепт {pk} ({image}): {error}'
+STOP_MESSAGE = (
+    'Готово за {elapsed:.2f} с: построено {built}, ошибок {failed}.')
+
+
+class Command(BaseCommand):
+    """
+    Построение миниатюр для рецептов, у которых их еще нет
+    (например, созданных до появления миниатюр).
+    python manage.py build_thumbnails
+    python manage.py build_thumbnails --all
+    """
+
+    help = HELP_MESSAGE
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Перестроить миниатюры всех рецептов.')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        recipes = Recipe.objects.exclude(image='')
+        if not options['all']:
+            recipes = recipes.filter(thumbnails_ready=False)
+        built = failed = 0
+        for pk, image in recipes.values_list('pk', 'image').iterator():
+            try:
+                build_thumbnails(pk, image)
+            except Exception as error:
+                failed += 1
+                self.stderr.write(
+                    ERROR_MESSAGE.format(pk=pk, image=image, error=error))
+            else:
+                built += 1
+        self.stdout.write(self.style.SUCCESS(STOP_MESSAGE.format(
+            elapsed=time.monotonic() - started, built=built, failed=failed)))
@@ -1,41 +1,119 @@
 import csv
+import json
+import os
+import time
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
 
+from api import ingredient_index
 from recipes.models import Ingredient
 
-HELP_MESSAGE = 'Импорт данных из data/ingredients.csv'
+HELP_MESSAGE = (
+    'Импорт данных из data/ingredients.csv и data/ingredients.json')
 START_MESSAGE = 'Начинаем импорт...'
-STOP_MESSAGE = 'Импорт закончен...'
-IMPORT_ERROR = 'Что-то пошло не так: {error}.'
-IMPORT_MESSAGE = 'Обрабатывается набор данных: {data}'
+STOP_MESSAGE = (
+    'Импорт закончен за {elapsed:.2f} с: '
+    'добавлено {created}, пропущено {skipped}.')
+DRY_RUN_MESSAGE = 'Пробный запуск: изменения в базе отменены.'
+FILE_NOT_FOUND_MESSAGE = 'Файл {path} не найден, пропускаем.'
+READ_MESSAGE = 'Прочитано записей из {path}: {count}'
+ROW_ERROR = 'Некорректная запись в {path} (№ {number}): {row}'
+NO_FILES_ERROR = 'Не найден ни один файл с ингридиентами.'
 # PATH_TO_CSV_FILES = 'data/ingredients.csv'
 # Для сборки Docker образа указать так
 PATH_TO_CSV_FILES = 'ingredients.csv'
+PATH_TO_JSON_FILES = 'ingredients.json'
+BATCH_SIZE = 500
 
 
 class Command(BaseCommand):
     """
     Класс для работы managment комманды.
-    Импорт информации из csv файла в модель Ingredient.
+    Импорт информации из csv и json файлов в модель Ingredient.
+    Повторный запуск безопасен: уже существующие ингридиенты пропускаются
+    (ограничение уникальности unique_ingredient).
     python manage.py import_into_db
+    python manage.py import_into_db --dry-run
     """
 
     help = HELP_MESSAGE
 
+    def add_arguments(self, parser):
+        parser.add_argument('--csv', default=PATH_TO_CSV_FILES)
+        parser.add_argument('--json', default=PATH_TO_JSON_FILES)
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Выполнить импорт и отменить изменения в базе.')
+
     def handle(self, *args, **options):
-        print(START_MESSAGE)
-        try:
-            with open(PATH_TO_CSV_FILES, encoding='utf-8') as file:
-                reader = csv.reader(file)
-                for row in reader:
-                    print(IMPORT_MESSAGE.format(data=row))
-                    name, measurement_unit = row
-                    Ingredient.objects.get_or_create(
-                        name=name, measurement_unit=measurement_unit
-                    )
-        except Exception as error:
-            print(IMPORT_ERROR.format(error=error))
-
-        finally:
-            print(STOP_MESSAGE)
+        self.stdout.write(START_MESSAGE)
+        started = time.monotonic()
+        rows = []
+        files_found = False
+        for path, reader in (
+            (options['csv'], self.read_csv),
+            (options['json'], self.read_json),
+        ):
+            if not os.path.exists(path):
+                self.stdout.write(FILE_NOT_FOUND_MESSAGE.format(path=path))
+                continue
+            files_found = True
+            file_rows = list(reader(path))
+            self.stdout.write(
+                READ_MESSAGE.format(path=path, count=len(file_rows)))
+            rows.extend(file_rows)
+        if not files_found:
+            raise CommandError(NO_FILES_ERROR)
+        # Дубликаты внутри файлов и между файлами убираются в памяти,
+        # порядок первого появления сохраняется
+        unique_rows = list(dict.fromkeys(rows))
+        with transaction.atomic():
+            count_before = Ingredient.objects.count()
+            Ingredient.objects.bulk_create(
+                (
+                    Ingredient(name=name, measurement_unit=measurement_unit)
+                    for name, measurement_unit in unique_rows
+                ),
+                batch_size=options['batch_size'],
+                ignore_conflicts=True
+            )
+            created = Ingredient.objects.count() - count_before
+            if options['dry_run']:
+                transaction.set_rollback(True)
+        if created and not options['dry_run']:
+            # bulk_create не отправляет сигналы post_save
+            ingredient_index.invalidate()
+        if options['dry_run']:
+            self.stdout.write(DRY_RUN_MESSAGE)
+        self.stdout.write(self.style.SUCCESS(STOP_MESSAGE.format(
+            elapsed=time.monotonic() - started,
+            created=created,
+            skipped=len(rows) - created)))
+
+    def read_csv(self, path):
+        with open(path, encoding='utf-8') as file:
+            for number, row in enumerate(csv.reader(file), start=1):
+                if len(row) != 2:
+                    raise CommandError(
+                        ROW_ERROR.format(path=path, number=number, row=row))
+                yield self.clean(path, number, *row)
+
+    def read_json(self, path):
+        with open(path, encoding='utf-8') as file:
+            data = json.load(file)
+        for number, item in enumerate(data, start=1):
+            try:
+                yield self.clean(
+                    path, number, item['name'], item['measurement_unit'])
+            except (KeyError, TypeError):
+                raise CommandError(
+                    ROW_ERROR.format(path=path, number=number, row=item))
+
+    def clean(self, path, number, name, measurement_unit):
+        name, measurement_unit = name.strip(), measurement_unit.strip()
+        if not name or not measurement_unit:
+            raise CommandError(ROW_ERROR.format(
+                path=path, number=number, row=(name, measurement_unit)))
+        return name, measurement_unit
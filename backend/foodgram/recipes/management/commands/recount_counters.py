@@ -0,0 +1,66 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from recipes.models import Favorite, Recipe
+from users.models import User
+
+HELP_MESSAGE = (
+    'Пересчет счетчиков Recipe.favorites_count и User.recipes_count')
+MISMATCH_MESSAGE = '{model}: расхождений счетчика {field} - {count}'
+DRY_RUN_MESSAGE = 'Пробный запуск: изменения в базе не внесены.'
+STOP_MESSAGE = 'Пересчет закончен за {elapsed:.2f} с.'
+
+
+def count_subquery(model, field):
+    """Число строк model, ссылающихся на объект через field."""
+    return Coalesce(Subquery(
+        model.objects.filter(
+            **{field: OuterRef('pk')}
+        ).order_by().values(field).annotate(
+            total=Count('pk')
+        ).values('total')
+    ), 0)
+
+
+class Command(BaseCommand):
+    """
+    Пересчет денормализованных счетчиков одним UPDATE на таблицу.
+    Нужен после загрузки данных в обход ORM или ручной правки базы.
+    python manage.py recount_counters
+    python manage.py recount_counters --dry-run
+    """
+
+    help = HELP_MESSAGE
+    counters = (
+        (Recipe, 'favorites_count', Favorite, 'recipe'),
+        (User, 'recipes_count', Recipe, 'author'),
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать число расхождений.')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        with transaction.atomic():
+            for model, field, related_model, related_field in self.counters:
+                actual = count_subquery(related_model, related_field)
+                mismatched = model.objects.annotate(
+                    actual=actual
+                ).exclude(**{field: F('actual')})
+                self.stdout.write(MISMATCH_MESSAGE.format(
+                    model=model.__name__, field=field,
+                    count=mismatched.count()))
+                if not options['dry_run']:
+                    model.objects.filter(
+                        pk__in=mismatched.values('pk')
+                    ).update(**{field: actual})
+        if options['dry_run']:
+            self.stdout.write(DRY_RUN_MESSAGE)
+        self.stdout.write(self.style.SUCCESS(
+            STOP_MESSAGE.format(elapsed=time.monotonic() - started)))
@@ -0,0 +1,217 @@
+import io
+import json
+import time
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import IntegrityError, connection, transaction
+from django.utils.dateparse import parse_datetime
+
+from api import ingredient_index, recipe_cache
+from api.versions import TAGS_VERSION, bump_version
+from recipes.management.commands.dump_recipes import BATCH_SIZE, open_dump
+from recipes.management.commands.recount_counters import count_subquery
+from recipes.models import (Ingredient, Recipe, RecipeIngredient, RecipeTag,
+                            Tag)
+from users.models import User
+
+HELP_MESSAGE = 'Загрузка рецептов из выгрузки dump_recipes'
+STOP_MESSAGE = (
+    'Загрузка закончена за {elapsed:.2f} с: рецептов {recipes}, '
+    'новых пользователей {users}, тегов {tags}, ингридиентов {ingredients}.')
+DRY_RUN_MESSAGE = 'Пробный запуск: изменения в базе отменены.'
+LINE_ERROR = 'Некорректная запись в {path} (строка {number}): {error!r}'
+CONFLICT_ERROR = (
+    '{model} с id {pk} уже есть в базе, но отличается: {existing} '
+    'вместо {restored}')
+INTEGRITY_ERROR = 'Рецепты не загружены: {error}'
+# Поля справочных записей, по которым проверяется, что запись с тем же
+# id в базе - та же самая
+NATURAL_KEYS = {
+    User: ('username',),
+    Tag: ('slug',),
+    Ingredient: ('name', 'measurement_unit'),
+}
+DATETIME_FIELDS = ('pub_date', 'updated_at', 'date_joined')
+
+
+def copy_value(value):
+    """Значение поля в текстовом формате COPY."""
+    if value is None:
+        return '\\N'
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace(
+        '\n', '\\n').replace('\r', '\\r')
+
+
+def insert_rows(model, objects):
+    """
+    Вставка объектов вместе с id, без сигналов и auto_now: в PostgreSQL
+    одним COPY, в остальных базах - executemany.
+    """
+    if not objects:
+        return
+    fields = model._meta.concrete_fields
+    rows = [
+        [field.get_db_prep_save(getattr(obj, field.attname), connection)
+         for field in fields]
+        for obj in objects
+    ]
+    table = connection.ops.quote_name(model._meta.db_table)
+    columns = ', '.join(
+        connection.ops.quote_name(field.column) for field in fields)
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            data = io.StringIO(''.join(
+                '\t'.join(map(copy_value, row)) + '\n' for row in rows))
+            cursor.copy_expert(
+                f'COPY {table} ({columns}) FROM STDIN', data)
+        else:
+            cursor.executemany(
+                f'INSERT INTO {table} ({columns}) '
+                f'VALUES ({", ".join(["%s"] * len(fields))})', rows)
+
+
+class Command(BaseCommand):
+    """
+    Загрузка выгрузки dump_recipes (.jsonl или .jsonl.gz) порциями
+    по chunk_size рецептов: в PostgreSQL через COPY, в SQLite - пакетными
+    INSERT. id всех записей сохраняются, последовательности id затем
+    сдвигаются за максимальный id. Авторы, теги и ингридиенты, которые
+    уже есть в базе с тем же id, не загружаются повторно (если запись
+    с тем же id другая - ошибка); рецепт с уже существующим id - ошибка.
+    Авторы загружаются обычными пользователями, без прав администратора;
+    если выгрузка сделана без --with-passwords, пароль автора
+    непригоден для входа, пока не задан заново.
+    Загрузка выполняется в одной транзакции; сигналы не отправляются,
+    поэтому счетчики авторов пересчитываются, а кеши api сбрасываются
+    в конце. Избранное и списки покупок не переносятся, миниатюры
+    картинок строит build_thumbnails.
+    python manage.py restore_recipes recipes.jsonl.gz
+    python manage.py restore_recipes recipes.jsonl.gz --dry-run
+    """
+
+    help = HELP_MESSAGE
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--chunk-size', type=int, default=BATCH_SIZE)
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Выполнить загрузку и отменить изменения в базе.')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        self.created = {User: 0, Tag: 0, Ingredient: 0}
+        self.authors = {}
+        recipes_count = 0
+        try:
+            with transaction.atomic():
+                for records in self.read(
+                        options['path'], options['chunk_size']):
+                    self.restore(records)
+                    recipes_count += len(records)
+                self.finish(options['chunk_size'])
+                if options['dry_run']:
+                    transaction.set_rollback(True)
+        except IntegrityError as error:
+            raise CommandError(INTEGRITY_ERROR.format(error=error))
+        if options['dry_run']:
+            self.stdout.write(DRY_RUN_MESSAGE)
+        else:
+            self.invalidate()
+        self.stdout.write(self.style.SUCCESS(STOP_MESSAGE.format(
+            elapsed=time.monotonic() - started, recipes=recipes_count,
+            users=self.created[User], tags=self.created[Tag],
+            ingredients=self.created[Ingredient])))
+
+    def read(self, path, chunk_size):
+        """Порции записей файла по chunk_size."""
+        with open_dump(path, 'r') as file:
+            lines = enumerate(file, start=1)
+            for chunk in iter(lambda: list(islice(lines, chunk_size)), []):
+                records = []
+                for number, line in chunk:
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError as error:
+                        raise CommandError(LINE_ERROR.format(
+                            path=path, number=number, error=error))
+                yield records
+
+    def restore(self, records):
+        references = {User: {}, Tag: {}, Ingredient: {}}
+        recipes, recipe_ingredients, recipe_tags = [], [], []
+        for record in records:
+            author = record.pop('author')
+            author.setdefault('password', make_password(None))
+            references[User][author['id']] = author
+            for item in record.pop('ingredients'):
+                ingredient = item.pop('ingredient')
+                references[Ingredient][ingredient['id']] = ingredient
+                recipe_ingredients.append(RecipeIngredient(
+                    recipe_id=record['id'], ingredient_id=ingredient['id'],
+                    **item))
+            for item in record.pop('tags'):
+                tag = item.pop('tag')
+                references[Tag][tag['id']] = tag
+                recipe_tags.append(RecipeTag(
+                    recipe_id=record['id'], tag_id=tag['id'], **item))
+            # Картинки переносятся без миниатюр, избранное - не переносится
+            recipes.append(Recipe(
+                author_id=author['id'], thumbnails_ready=False,
+                favorites_count=0, **self.parse(record)))
+        for model, rows in references.items():
+            new_rows = self.get_new_rows(model, dict(rows))
+            insert_rows(model, [model(**self.parse(row)) for row in new_rows])
+            self.created[model] += len(new_rows)
+        self.authors.update(
+            (pk, author['username'])
+            for pk, author in references[User].items())
+        for model, objects in (
+            (Recipe, recipes),
+            (RecipeIngredient, recipe_ingredients),
+            (RecipeTag, recipe_tags),
+        ):
+            insert_rows(model, objects)
+
+    def parse(self, row):
+        for field in DATETIME_FIELDS:
+            if field in row:
+                row[field] = parse_datetime(row[field])
+        return row
+
+    def get_new_rows(self, model, rows):
+        """Записи rows, которых еще нет в базе (по id)."""
+        fields = NATURAL_KEYS[model]
+        existing = model.objects.filter(pk__in=rows).values_list('pk', *fields)
+        for pk, *values in existing:
+            restored = [rows[pk][field] for field in fields]
+            if values != restored:
+                raise CommandError(CONFLICT_ERROR.format(
+                    model=model.__name__, pk=pk, existing=values,
+                    restored=restored))
+            del rows[pk]
+        return list(rows.values())
+
+    def finish(self, chunk_size):
+        """Последовательности id и счетчики рецептов авторов."""
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), (
+                User, Tag, Ingredient, Recipe, RecipeIngredient, RecipeTag,
+            )):
+                cursor.execute(sql)
+        author_ids = sorted(self.authors)
+        for start in range(0, len(author_ids), chunk_size):
+            User.objects.filter(
+                pk__in=author_ids[start:start + chunk_size]
+            ).update(recipes_count=count_subquery(Recipe, 'author'))
+
+    def invalidate(self):
+        """Загрузка в обход сигналов: сбросить кеши api."""
+        if self.created[Ingredient]:
+            ingredient_index.invalidate()
+        if self.created[Tag]:
+            bump_version(TAGS_VERSION)
+        recipe_cache.invalidate(*self.authors.values())
@@ -0,0 +1,33 @@
+from django.db import migrations
+
+# Индекс повторяет выражение, которое Django строит для name__icontains
+# в PostgreSQL: UPPER("name"::text) LIKE UPPER('%...%')
+CREATE_INDEX = (
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm;'
+    'CREATE INDEX IF NOT EXISTS recipes_ingredient_name_trgm '
+    'ON recipes_ingredient USING gin (UPPER(name::text) gin_trgm_ops);'
+)
+DROP_INDEX = 'DROP INDEX IF EXISTS recipes_ingredient_name_trgm;'
+
+
+def create_trigram_index(apps, schema_editor):
+    # В SQLite (NEED_SQLITE) нет pg_trgm: поиск по подстроке
+    # выполняется по индексу ингридиентов в памяти
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(CREATE_INDEX)
+
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(DROP_INDEX)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
@@ -0,0 +1,62 @@
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def collapse_recipe_ingredients(RecipeIngredient):
+    """
+    Если рецепт ссылался на несколько дубликатов одного ингридиента,
+    после переноса ссылок у него несколько строк с одним ингридиентом:
+    оставляем одну строку с суммой количества.
+    """
+    duplicates = list(RecipeIngredient.objects.values(
+        'recipe_id', 'ingredient_id'
+    ).annotate(
+        keep_id=Min('id'), total=Count('id'), amount=Sum('count')
+    ).order_by().filter(total__gt=1))
+    for duplicate in duplicates:
+        links = RecipeIngredient.objects.filter(
+            recipe_id=duplicate['recipe_id'],
+            ingredient_id=duplicate['ingredient_id'])
+        links.filter(id=duplicate['keep_id']).update(
+            count=duplicate['amount'])
+        links.exclude(id=duplicate['keep_id']).delete()
+
+
+def merge_duplicate_ingredients(apps, schema_editor):
+    """
+    Перед добавлением ограничения уникальности оставляем по одному
+    ингридиенту на пару (name, measurement_unit), ссылки в рецептах
+    переносим на оставшуюся запись.
+    """
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    RecipeIngredient = apps.get_model('recipes', 'RecipeIngredient')
+    duplicates = Ingredient.objects.values(
+        'name', 'measurement_unit'
+    ).annotate(
+        keep_id=Min('id'), total=Count('id')
+    ).order_by().filter(total__gt=1)
+    for duplicate in duplicates:
+        extra = Ingredient.objects.filter(
+            name=duplicate['name'],
+            measurement_unit=duplicate['measurement_unit']
+        ).exclude(id=duplicate['keep_id'])
+        RecipeIngredient.objects.filter(ingredient__in=extra).update(
+            ingredient_id=duplicate['keep_id'])
+        extra.delete()
+    collapse_recipe_ingredients(RecipeIngredient)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0002_ingredient_name_trigram_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            merge_duplicate_ingredients, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('name', 'measurement_unit'), name='unique_ingredient'),
+        ),
+    ]
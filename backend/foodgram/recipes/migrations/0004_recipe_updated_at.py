@@ -0,0 +1,25 @@
+from django.db import migrations, models
+import django.utils.timezone
+
+
+def set_updated_at(apps, schema_editor):
+    """Для существующих рецептов дата изменения - дата создания."""
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Recipe.objects.update(updated_at=models.F('pub_date'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0003_ingredient_unique_ingredient'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now, verbose_name='Дата изменения'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(set_updated_at, migrations.RunPython.noop),
+    ]
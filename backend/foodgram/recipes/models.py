@@ -2,7 +2,7 @@ from django.conf import settings
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
 
-from users.models import User
+from users.models import CountersMixin, User
 
 
 class Tag(models.Model):
@@ -54,12 +54,17 @@ class Ingredient(models.Model):
         ordering = ('pk',)
         verbose_name = 'ингридиент'
         verbose_name_plural = '2. Ингридиенты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['name', 'measurement_unit'],
+                name='unique_ingredient')
+        ]
 
     def __str__(self):
         return self.name
 
 
-class Recipe(models.Model):
+class Recipe(CountersMixin, models.Model):
     """Модель рецептов."""
 
     pub_date = models.DateTimeField(
@@ -67,6 +72,11 @@ class Recipe(models.Model):
         auto_now_add=True,
         db_index=True
     )
+    # Обновляется при каждом сохранении рецепта (ETag в api)
+    updated_at = models.DateTimeField(
+        'Дата изменения',
+        auto_now=True
+    )
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -94,6 +104,12 @@ class Recipe(models.Model):
         upload_to='recipes/image/',
         help_text='Выберете картинку для рецепта'
     )
+    # Миниатюры картинки построены (recipes/thumbnails.py)
+    thumbnails_ready = models.BooleanField(
+        'Миниатюры готовы',
+        default=False,
+        editable=False
+    )
     name = models.CharField(
         'Наименование рецепта',
         max_length=settings.MAX_LENGTH_RECIPE_NAME,
@@ -115,11 +131,30 @@ class Recipe(models.Model):
         verbose_name='Время приготовления',
         help_text='Введите время приготовления (в минутах)'
     )
+    # Счетчик поддерживается сигналами (recipes/signals.py),
+    # пересчет: python manage.py recount_counters
+    favorites_count = models.PositiveIntegerField(
+        'В избранном',
+        default=0,
+        editable=False
+    )
+
+    counter_fields = ('favorites_count',)
 
     class Meta:
         ordering = ('pub_date',)
         verbose_name = 'рецепт'
         verbose_name_plural = '3. Рецепты'
+        indexes = [
+            # Сортировка ordering=popular
+            models.Index(
+                fields=['-favorites_count', '-pub_date'],
+                name='recipe_popular_idx'),
+            # Фильтр author и сортировка списка по дате
+            models.Index(
+                fields=['author', 'pub_date'],
+                name='recipe_author_pub_date_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -162,6 +197,13 @@ class RecipeIngredient(models.Model):
         ordering = ('pk',)
         verbose_name = 'у рецепта нужные ингридиенты'
         verbose_name_plural = '4. Рецепты и ингридиенты'
+        indexes = [
+            # Список покупок: суммирование count по ингридиентам рецептов
+            # читается из индекса, без обращения к таблице
+            models.Index(
+                fields=['recipe', 'ingredient', 'count'],
+                name='recipeingredient_recipe_idx'),
+        ]
 
     def __str__(self):
         return f'{self.recipe.name} {self.ingredient.name}'
@@ -190,6 +232,12 @@ class RecipeTag(models.Model):
         ordering = ('pk',)
         verbose_name = 'у рецепта нужные теги'
         verbose_name_plural = '5. Рецепты и теги'
+        indexes = [
+            # Фильтр tags: рецепты тега без обращения к таблице
+            models.Index(
+                fields=['tag', 'recipe'],
+                name='recipetag_tag_recipe_idx'),
+        ]
 
     def __str__(self):
         return f'{self.recipe.name} {self.tag.name}'
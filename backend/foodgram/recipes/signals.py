@@ -0,0 +1,74 @@
+"""
+Денормализованные счетчики: Recipe.favorites_count и User.recipes_count.
+Изменяются одним UPDATE с F() выражением, поэтому одновременные запросы
+не теряют изменения. Пересчет: python manage.py recount_counters
+Миниатюры картинок рецептов (recipes/thumbnails.py).
+"""
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from recipes.models import Favorite, Recipe
+from recipes.thumbnails import schedule_thumbnails
+from users.models import User
+
+
+def change_counter(queryset, field, delta):
+    if delta < 0:
+        # Счетчик не уходит в минус, даже если он уже рассинхронизирован
+        queryset = queryset.filter(**{f'{field}__gt': 0})
+    queryset.update(**{field: F(field) + delta})
+
+
+@receiver(post_save, sender=Favorite)
+def favorite_created(instance, created, **kwargs):
+    if created:
+        change_counter(
+            Recipe.objects.filter(pk=instance.recipe_id),
+            'favorites_count', 1)
+
+
+@receiver(post_delete, sender=Favorite)
+def favorite_deleted(instance, **kwargs):
+    change_counter(
+        Recipe.objects.filter(pk=instance.recipe_id), 'favorites_count', -1)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_created(instance, created, **kwargs):
+    if created:
+        change_counter(
+            User.objects.filter(pk=instance.author_id), 'recipes_count', 1)
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(instance, **kwargs):
+    change_counter(
+        User.objects.filter(pk=instance.author_id), 'recipes_count', -1)
+
+
+@receiver(pre_save, sender=Recipe)
+def image_changed(instance, update_fields=None, **kwargs):
+    """
+    Картинка заменена: миниатюры нужно построить заново.
+    Сохранения без поля image (счетчики, отметка миниатюр) - без запроса.
+    """
+    if instance._state.adding or (
+        update_fields is not None and 'image' not in update_fields
+    ):
+        return
+    stored_image = Recipe.objects.filter(
+        pk=instance.pk).values_list('image', flat=True).first()
+    if stored_image != instance.image.name:
+        instance.thumbnails_ready = False
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_saved(instance, **kwargs):
+    """Построить миниатюры после фиксации транзакции."""
+    if instance.image and not instance.thumbnails_ready:
+        recipe_id, image_name = instance.pk, instance.image.name
+        author = instance.author
+        transaction.on_commit(
+            lambda: schedule_thumbnails(recipe_id, image_name, author))
@@ -0,0 +1,19 @@
+"""Фоновые задачи приложения recipes (очередь jobs)."""
+import io
+
+from django.core.management import call_command
+
+from jobs.registry import task
+from recipes import thumbnails
+
+
+@task('build_thumbnails')
+def build_thumbnails(recipe_id, image_name):
+    thumbnails.build_thumbnails(recipe_id, image_name)
+
+
+@task('recount_counters')
+def recount_counters():
+    output = io.StringIO()
+    call_command('recount_counters', stdout=output)
+    return output.getvalue()
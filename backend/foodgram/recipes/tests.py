@@ -0,0 +1,165 @@
+import io
+import json
+import os
+
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+
+from api.tests import ApiTestCase
+from recipes.models import Favorite, Recipe
+from users.models import User
+
+
+class MergeDuplicateIngredientsTest(TransactionTestCase):
+    """
+    Миграция 0003: рецепт с двумя дубликатами одного ингридиента
+    получает одну строку с суммой количества.
+    """
+
+    migrate_from = [('recipes', '0002_ingredient_name_trigram_index')]
+    migrate_to = [('recipes', '0003_ingredient_unique_ingredient')]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        # Остальные тесты работают со схемой последней миграции
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_links_are_collapsed(self):
+        apps = self.migrate(self.migrate_from)
+        Ingredient = apps.get_model('recipes', 'Ingredient')
+        Recipe = apps.get_model('recipes', 'Recipe')
+        RecipeIngredient = apps.get_model('recipes', 'RecipeIngredient')
+        # Миграции users не откатываются: автор - текущей моделью
+        author = User.objects.create(username='author', email='a@localhost')
+        salt, duplicate = (
+            Ingredient.objects.create(name='соль', measurement_unit='г')
+            for _ in range(2))
+        pepper = Ingredient.objects.create(name='перец', measurement_unit='г')
+        recipe = Recipe.objects.create(
+            author_id=author.pk, name='Рецепт', text='Описание',
+            cooking_time=10, image='recipes/image/test.png')
+        for ingredient, count in ((salt, 5), (duplicate, 3), (pepper, 1)):
+            RecipeIngredient.objects.create(
+                recipe=recipe, ingredient=ingredient, count=count)
+
+        apps = self.migrate(self.migrate_to)
+        RecipeIngredient = apps.get_model('recipes', 'RecipeIngredient')
+        self.assertEqual(
+            sorted(RecipeIngredient.objects.filter(
+                recipe_id=recipe.pk
+            ).values_list('ingredient_id', 'count')),
+            [(salt.pk, 8), (pepper.pk, 1)])
+
+
+class StaleCountersTest(ApiTestCase):
+    """
+    Счетчики, измененные UPDATE с F(), не затираются при сохранении
+    объекта, загруженного до изменения.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.author = self.create_user('author')
+        self.recipe, = self.create_recipes(self.author, 1)
+
+    def test_recipe_favorites_count_survives_stale_save(self):
+        stale_recipe = Recipe.objects.get(pk=self.recipe.pk)
+        for username in ('first', 'second'):
+            Favorite.objects.create(
+                user=self.create_user(username), recipe=self.recipe)
+        stale_recipe.name = 'Новое название'
+        stale_recipe.save()
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.name, 'Новое название')
+        self.assertEqual(self.recipe.favorites_count, 2)
+
+    def test_user_recipes_count_survives_stale_save(self):
+        stale_author = User.objects.get(pk=self.author.pk)
+        self.create_recipes(self.author, 1)
+        stale_author.username = 'renamed'
+        stale_author.save()
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.username, 'renamed')
+        self.assertEqual(self.author.recipes_count, 2)
+
+    def test_deferred_fields_are_not_saved(self):
+        recipe = Recipe.objects.only('pk', 'name').get(pk=self.recipe.pk)
+        recipe.name = 'Новое название'
+        with CaptureQueriesContext(connection) as context:
+            recipe.save()
+        updates = [
+            query['sql'] for query in context.captured_queries
+            if query['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 1)
+        self.assertIn('SET "name" = ', updates[0])
+        self.assertNotIn(',', updates[0].split(' WHERE ')[0])
+
+
+class ImageChangedTest(ApiTestCase):
+    """Отметка миниатюр сбрасывается только при замене картинки."""
+
+    def setUp(self):
+        super().setUp()
+        self.recipe, = self.create_recipes(self.create_user('author'), 1)
+        Recipe.objects.update(thumbnails_ready=True)
+        self.recipe.refresh_from_db()
+
+    def test_save_without_image_does_not_read_recipe(self):
+        self.recipe.name = 'Новое название'
+        with CaptureQueriesContext(connection) as context:
+            self.recipe.save(update_fields=['name'])
+        self.assertFalse([
+            query['sql'] for query in context.captured_queries
+            if query['sql'].startswith('SELECT')
+            and 'FROM "recipes_recipe"' in query['sql']])
+        self.recipe.refresh_from_db()
+        self.assertTrue(self.recipe.thumbnails_ready)
+
+    def test_new_image_resets_thumbnails(self):
+        self.recipe.image = 'recipes/image/other.png'
+        self.recipe.save()
+        self.recipe.refresh_from_db()
+        self.assertFalse(self.recipe.thumbnails_ready)
+
+
+class DumpRecipesTest(ApiTestCase):
+    """Хеши паролей авторов выгружаются только с --with-passwords."""
+
+    def setUp(self):
+        super().setUp()
+        self.author = self.create_user('author')
+        self.create_recipes(self.author, 1)
+        self.path = os.path.join(settings.CACHE_DIR, 'recipes.jsonl')
+
+    def dump(self, *args):
+        call_command('dump_recipes', self.path, *args, stdout=io.StringIO())
+        with open(self.path, encoding='utf-8') as file:
+            return json.loads(file.readline())['author']
+
+    def restore(self):
+        # Загрузка в пустую базу
+        User.objects.filter(pk=self.author.pk).delete()
+        call_command('restore_recipes', self.path, stdout=io.StringIO())
+        return User.objects.get(pk=self.author.pk)
+
+    def test_password_is_not_dumped(self):
+        self.assertNotIn('password', self.dump())
+        author = self.restore()
+        self.assertEqual(author.username, 'author')
+        self.assertFalse(author.has_usable_password())
+        self.assertEqual(author.recipes_count, 1)
+
+    def test_password_is_dumped_with_flag(self):
+        self.assertEqual(
+            self.dump('--with-passwords')['password'], self.author.password)
+        self.assertTrue(self.restore().check_password('author_password'))
@@ -0,0 +1,130 @@
+"""
+Миниатюры картинок рецептов.
+Картинка обрабатывается в пуле потоков после сохранения рецепта
+(или в очереди jobs, если THUMBNAIL_QUEUE = 'jobs'),
+поэтому запрос пользователя не ждет Pillow. Для каждого размера из
+RECIPE_THUMBNAIL_SIZES сохраняется WebP и JPEG (для браузеров без WebP).
+Пока миниатюры не готовы (Recipe.thumbnails_ready), api отдает оригинал.
+"""
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection
+from PIL import Image, features
+
+from jobs.registry import enqueue
+
+THUMBNAILS_DIR = 'recipes/thumbnails'
+# Параметры сохранения по расширению файла
+FORMATS = {
+    'webp': {'format': 'WEBP', 'quality': 80, 'method': 4},
+    'jpeg': {
+        'format': 'JPEG', 'quality': 85, 'optimize': True,
+        'progressive': True},
+}
+if not features.check('webp'):
+    # Pillow собран без libwebp: только JPEG
+    del FORMATS['webp']
+
+logger = logging.getLogger(__name__)
+executor = None
+executor_lock = threading.Lock()
+
+
+def get_thumbnail_name(image_name, size, extension):
+    # Расширение оригинала остается в имени: temp.png и temp.jpg различны
+    stem = os.path.basename(image_name).replace('.', '_')
+    return f'{THUMBNAILS_DIR}/{stem}_{size}.{extension}'
+
+
+def get_thumbnail_urls(recipe):
+    """
+    Ссылки на миниатюры: {размер: {расширение: url}}.
+    None, если миниатюры еще не готовы.
+    """
+    if not recipe.thumbnails_ready or not recipe.image:
+        return None
+    return {
+        size: {
+            extension: default_storage.url(
+                get_thumbnail_name(recipe.image.name, size, extension))
+            for extension in FORMATS
+        }
+        for size in settings.RECIPE_THUMBNAIL_SIZES
+    }
+
+
+def render_thumbnails(image_name):
+    """Сохранить миниатюры всех размеров для картинки image_name."""
+    with default_storage.open(image_name, 'rb') as file:
+        image = Image.open(file)
+        # JPEG сразу декодируется в уменьшенном масштабе
+        image.draft('RGB', max(settings.RECIPE_THUMBNAIL_SIZES.values()))
+        image.load()
+    for size, box in settings.RECIPE_THUMBNAIL_SIZES.items():
+        thumbnail = image.copy()
+        thumbnail.thumbnail(box, Image.LANCZOS)
+        for extension, options in FORMATS.items():
+            if options['format'] == 'JPEG' and thumbnail.mode != 'RGB':
+                thumbnail = thumbnail.convert('RGB')
+            buffer = io.BytesIO()
+            thumbnail.save(buffer, **options)
+            name = get_thumbnail_name(image_name, size, extension)
+            # Имя должно остаться прежним, а не получить суффикс
+            if default_storage.exists(name):
+                default_storage.delete(name)
+            default_storage.save(name, ContentFile(buffer.getvalue()))
+
+
+def build_thumbnails(recipe_id, image_name):
+    """
+    Построить миниатюры и отметить рецепт.
+    Если картинку рецепта успели заменить, отметка не ставится
+    (см. сигнал image_changed).
+    """
+    from recipes.models import Recipe
+
+    render_thumbnails(image_name)
+    recipe = Recipe.objects.select_related('author').filter(
+        pk=recipe_id, image=image_name).first()
+    if recipe is not None:
+        recipe.thumbnails_ready = True
+        recipe.save(update_fields=('thumbnails_ready', 'updated_at'))
+
+
+def run_job(recipe_id, image_name):
+    try:
+        build_thumbnails(recipe_id, image_name)
+    except Exception:
+        # Рецепт остается с оригинальной картинкой
+        logger.exception('Миниатюры для %s не построены', image_name)
+    finally:
+        # Соединение с базой принадлежит потоку пула
+        connection.close()
+
+
+def schedule_thumbnails(recipe_id, image_name, user=None):
+    """
+    Поставить построение миниатюр в очередь пула потоков или jobs.
+    Задача jobs принадлежит user (автору рецепта): он видит ее в api/jobs/.
+    """
+    global executor
+    if settings.THUMBNAIL_QUEUE == 'jobs':
+        # Обработчики run_workers в отдельных процессах
+        enqueue(
+            'build_thumbnails', user=user, recipe_id=recipe_id,
+            image_name=image_name)
+        return
+    with executor_lock:
+        # Пул создается в процессе gunicorn, а не до fork
+        if executor is None:
+            executor = ThreadPoolExecutor(
+                max_workers=settings.THUMBNAIL_WORKERS,
+                thread_name_prefix='thumbnails')
+    executor.submit(run_job, recipe_id, image_name)
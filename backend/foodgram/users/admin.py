@@ -27,5 +27,6 @@ class FollowAdmin(admin.ModelAdmin):
         'user',
         'author'
     )
-    list_editable = ('user', 'author')
-    search_fields = ('user', 'author')
+    list_select_related = ('user', 'author')
+    search_fields = ('user__username', 'author__username')
+    autocomplete_fields = ('user', 'author')
@@ -0,0 +1,31 @@
+from django.contrib.auth.backends import ModelBackend
+from django.core.exceptions import PermissionDenied
+
+from users.models import User
+
+
+class EmailBackend(ModelBackend):
+    """
+    Вход по адресу электронной почты (без учета регистра).
+    Пользователь и его токен читаются одним запросом.
+    Адреса, различающиеся только регистром, могли быть заведены
+    до проверки при регистрации: пароль проверяется у каждого из них.
+    """
+
+    def authenticate(self, request, email=None, password=None):
+        if email is None or password is None:
+            return None
+        # Индекс users_user_email_upper (миграция users 0003)
+        users = User.objects.select_related('auth_token').filter(
+            email__iexact=email).order_by('pk')
+        if not users:
+            # Время ответа не должно выдавать, есть ли такой адрес
+            User().set_password(password)
+        for user in users:
+            if (
+                user.check_password(password)
+                and self.user_can_authenticate(user)
+            ):
+                return user
+        # Следующие бэкенды (ModelBackend) не проверяют пароль повторно
+        raise PermissionDenied
@@ -0,0 +1,31 @@
+from django.db import migrations
+
+# Индекс повторяет выражение, которое Django строит для email__iexact
+# в PostgreSQL: UPPER("email"::text) = UPPER('...')
+CREATE_INDEX = (
+    'CREATE INDEX IF NOT EXISTS users_user_email_upper '
+    'ON users_user (UPPER(email::text));'
+)
+DROP_INDEX = 'DROP INDEX IF EXISTS users_user_email_upper;'
+
+
+def create_email_index(apps, schema_editor):
+    # В SQLite iexact выполняется через LIKE, индекс по выражению не нужен
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(CREATE_INDEX)
+
+
+def drop_email_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(DROP_INDEX)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_user_recipes_count'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_email_index, drop_email_index),
+    ]
@@ -3,7 +3,35 @@ from django.contrib.auth.models import AbstractUser
 from django.db import models
 
 
-class User(AbstractUser):
+class CountersMixin:
+    """
+    Денормализованные счетчики counter_fields изменяются только UPDATE
+    с F() выражением (recipes/signals.py). save() уже сохраненного
+    объекта без update_fields их не записывает: объект мог быть загружен
+    до изменения счетчика (админка, кеш токенов, долгий запрос),
+    и прежнее значение затерло бы изменения других запросов.
+    """
+
+    counter_fields = ()
+
+    def save(self, *args, **kwargs):
+        if (
+            not args
+            and not self._state.adding
+            and kwargs.get('update_fields') is None
+            and not kwargs.get('force_insert')
+        ):
+            # Отложенные поля (only / defer) не записываются, как и в
+            # Model.save
+            skipped = set(self.counter_fields) | self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.attname not in skipped
+            ]
+        super().save(*args, **kwargs)
+
+
+class User(CountersMixin, AbstractUser):
     """Кастомная модель пользователя."""
 
     email = models.EmailField(
@@ -23,6 +51,15 @@ class User(AbstractUser):
         'Пароль',
         max_length=settings.MAX_LENGTH_PASSWORD
     )
+    # Счетчик поддерживается сигналами (recipes/signals.py),
+    # пересчет: python manage.py recount_counters
+    recipes_count = models.PositiveIntegerField(
+        'Количество рецептов',
+        default=0,
+        editable=False
+    )
+
+    counter_fields = ('recipes_count',)
 
     class Meta:
         ordering = ('pk',)